@@ -1,23 +1,71 @@
+import multiprocessing
 import os
-import PyPDF2
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from retriever.ModelRegistry import ModelRegistry
+from retriever.PdfTextStore import PdfTextStore
+
+# Default cap on chunking processes, since every concurrent pipeline job starts its own pool
+MAX_WORKERS = 4
+# Fewer files are chunked in the current process: starting the pool and loading the tokenizer in each
+# worker costs more than chunking the handful of papers selected for a query
+MIN_PARALLEL_FILES = 8
 
 
 class Chunkenizer:
-    def __init__(self, papers_folder):
+    def __init__(self, papers_folder, pdf_text_store=None, tokenizer_name=None, chunk_tokens=512, chunk_overlap_tokens=32,
+                 registry=None):
         """
         Initialize the Chunkenizer with the specified papers folder.
+        By default chunks are 1500 characters long. When tokenizer_name is given, chunks are instead measured
+        with that tokenizer and packed up to the embedding window, so no text is truncated at embedding time.
         Args:
             papers_folder (str): Path to the folder containing the papers.
+            pdf_text_store (PdfTextStore): Shared store of extracted PDF text. A default store is created if omitted.
+            tokenizer_name (str): Hugging Face name of the embedding model whose tokenizer sizes the chunks.
+            chunk_tokens (int): Embedding window in tokens, including the special tokens added by the tokenizer.
+            chunk_overlap_tokens (int): Number of tokens shared by consecutive chunks in token mode.
+            registry (ModelRegistry): Registry providing the shared tokenizer. Defaults to the process-wide one,
+                so each worker process of process_files loads the tokenizer once, in its initializer.
         """
         if not os.path.exists(papers_folder):
             raise FileNotFoundError(f"The provided papers folder '{papers_folder}' does not exist.")
         self.papers_folder = papers_folder
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=50,
-            separators=[".", ",", " ", ""]
-        )
+        self.pdf_text_store = pdf_text_store or PdfTextStore()
+        self.tokenizer_name = tokenizer_name
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        # Seconds spent reading or extracting file text, including time spent in worker processes
+        self.extraction_seconds = 0.0
+
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        if tokenizer_name is None:
+            self.splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1500,
+                chunk_overlap=50,
+                separators=[".", ",", " ", ""]
+            )
+        else:
+            tokenizer = (registry or ModelRegistry.shared()).get_tokenizer(tokenizer_name)
+            # Leave room for the [CLS] and [SEP] tokens added at embedding time
+            self.splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+                tokenizer,
+                chunk_size=chunk_tokens - tokenizer.num_special_tokens_to_add(),
+                chunk_overlap=chunk_overlap_tokens,
+                separators=[".", ",", " ", ""]
+            )
+
+    @property
+    def signature(self):
+        """
+        Describe the chunking settings, so chunks produced under other settings can be detected.
+        Returns:
+            str: The chunking mode and its parameters.
+        """
+        if self.tokenizer_name is None:
+            return "characters:1500:50"
+        return f"tokens:{self.tokenizer_name}:{self.chunk_tokens}:{self.chunk_overlap_tokens}"
 
     def process_file(self, file_path):
         """
@@ -48,11 +96,9 @@ class Chunkenizer:
         Returns:
             list: A list of text chunks from the PDF.
         """
-        text = ""
-        with open(pdf_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
+        start = time.perf_counter()
+        text = self.pdf_text_store.get_text(pdf_path)
+        self.extraction_seconds += time.perf_counter() - start
         return self.splitter.split_text(text)
 
     def _process_txt(self, txt_path):
@@ -64,8 +110,10 @@ class Chunkenizer:
         Returns:
             list: A list of text chunks from the TXT file.
         """
+        start = time.perf_counter()
         with open(txt_path, "r", encoding="utf-8") as f:
             text = f.read()
+        self.extraction_seconds += time.perf_counter() - start
         return self.splitter.split_text(text)
 
     def chunk_text(self, text):
@@ -79,6 +127,111 @@ class Chunkenizer:
         """
         return self.splitter.split_text(text)
 
+    def list_files(self, folder=None):
+        """
+        List the supported files in a folder.
+        Args:
+            folder (str): Folder to scan. Defaults to the papers folder.
+
+        Returns:
+            list: Paths of the PDF and TXT files in the folder, sorted by name.
+        """
+        folder = folder or self.papers_folder
+        return [
+            os.path.join(folder, f) for f in sorted(os.listdir(folder))
+            if f.endswith('.pdf') or f.endswith('.txt')
+        ]
+
+    def process_files(self, file_paths, max_workers=None, min_parallel_files=MIN_PARALLEL_FILES):
+        """
+        Extract and chunk many files in parallel, streaming results back as each file finishes.
+        Files are spread across a process pool so PDF parsing and splitting use several cores. Workers are
+        spawned rather than forked, since forking a process that already runs torch, tokenizer or pipeline
+        threads can deadlock the children. Fewer than min_parallel_files files, or max_workers=1, are
+        processed in the current process.
+        Args:
+            file_paths (list): Paths of the files to process.
+            max_workers (int): Number of worker processes. Defaults to the number of CPUs, at most MAX_WORKERS.
+            min_parallel_files (int): Smallest number of files processed in a pool.
+
+        Yields:
+            tuple: The file path and its list of text chunks, in completion order.
+        """
+        file_paths = list(file_paths)
+        if max_workers is None:
+            max_workers = min(MAX_WORKERS, os.cpu_count() or 1)
+        max_workers = min(max_workers, len(file_paths))
+        if len(file_paths) < min_parallel_files or max_workers <= 1:
+            for file_path in file_paths:
+                yield file_path, self.process_file(file_path)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_worker,
+            initargs=(self._worker_config(),)
+        ) as executor:
+            futures = {executor.submit(_process_file_in_worker, path): path for path in file_paths}
+            for future in as_completed(futures):
+                chunks, extraction_seconds = future.result()
+                self.extraction_seconds += extraction_seconds
+                yield futures[future], chunks
+
+    def process_folder(self, folder=None, max_workers=None):
+        """
+        Extract and chunk every supported file in a folder in parallel.
+        Args:
+            folder (str): Folder to process. Defaults to the papers folder.
+            max_workers (int): Number of worker processes. Defaults to the number of CPUs, at most MAX_WORKERS.
+
+        Yields:
+            tuple: The file path and its list of text chunks, in completion order.
+        """
+        yield from self.process_files(self.list_files(folder), max_workers=max_workers)
+
+    def _worker_config(self):
+        """
+        Collect the arguments needed to rebuild this Chunkenizer inside a worker process.
+        Returns:
+            dict: Keyword arguments for the Chunkenizer constructor.
+        """
+        return {
+            "papers_folder": self.papers_folder,
+            "pdf_text_store": PdfTextStore(self.pdf_text_store.cache_dir),
+            "tokenizer_name": self.tokenizer_name,
+            "chunk_tokens": self.chunk_tokens,
+            "chunk_overlap_tokens": self.chunk_overlap_tokens
+        }
+
+
+# Chunkenizer rebuilt once per worker process by _initialize_worker
+_worker_chunkenizer = None
+
+
+def _initialize_worker(config):
+    """
+    Build the Chunkenizer used by a worker process of Chunkenizer.process_files.
+    Args:
+        config (dict): Keyword arguments returned by Chunkenizer._worker_config.
+    """
+    global _worker_chunkenizer
+    _worker_chunkenizer = Chunkenizer(**config)
+
+
+def _process_file_in_worker(file_path):
+    """
+    Extract and chunk one file inside a worker process.
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        tuple: A list of text chunks from the file and the seconds spent extracting its text.
+    """
+    extraction_seconds = _worker_chunkenizer.extraction_seconds
+    chunks = _worker_chunkenizer.process_file(file_path)
+    return chunks, _worker_chunkenizer.extraction_seconds - extraction_seconds
+
 
 if __name__ == "__main__":
     print("Testing Chunkenizer functionality...")
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Default location for all on-disk caches, next to the repository's papers folder
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+
+
+class DiskCache:
+    def __init__(self, path, max_entries=100000):
+        """
+        Initialize a persistent key-value cache backed by a SQLite file.
+        Entries are evicted in least-recently-used order once the cache holds more than max_entries.
+        Args:
+            path (str): Path to the SQLite file. Parent folders are created if needed.
+            max_entries (int): Maximum number of entries kept on disk.
+        """
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._connection.commit()
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once and mark the hits as recently used.
+        Args:
+            keys (list): Keys to look up.
+
+        Returns:
+            dict: Mapping from each key found in the cache to its stored bytes.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so query in slices
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        """
+        Look up a single key.
+        Args:
+            key (str): Key to look up.
+
+        Returns:
+            bytes: The stored value, or None when the key is not cached.
+        """
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        """
+        Store several entries and evict the least recently used ones if the cache is over its bound.
+        Args:
+            items (dict): Mapping from key to bytes value.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, last_access) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()]
+            )
+            self._evict()
+            self._connection.commit()
+
+    def set(self, key, value):
+        """
+        Store a single entry.
+        Args:
+            key (str): Key of the entry.
+            value (bytes): Value to store.
+        """
+        self.set_many({key: value})
+
+    def _evict(self):
+        """
+        Delete the least recently used entries beyond max_entries. Must be called with the lock held.
+        """
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+
+    def stats(self):
+        """
+        Get hit and miss counters for this cache instance.
+        Returns:
+            dict: Number of hits, misses and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.commit()
@@ -1,45 +1,71 @@
+import hashlib
 import json
-import torch
+import numpy as np
 import uuid
-from transformers import AutoModel, AutoTokenizer
-from qdrant_client import QdrantClient
-from qdrant_client.models import CollectionInfo, VectorParams, PointStruct
+from concurrent.futures import ThreadPoolExecutor
+from retriever.EmbeddingBackend import cache_model_key, resolve_backend
+from retriever.EmbeddingCache import EmbeddingCache
+from retriever.ModelRegistry import ModelRegistry
+from retriever.VectorStore import resolve_vector_store
 
 
 class Embbedingator:
-    def __init__(self, model_name="BAAI/bge-small-en", qdrant_host="localhost", qdrant_port=6333):
+    def __init__(self, model_name="BAAI/bge-small-en", qdrant_host="localhost", qdrant_port=6333, use_cache=True,
+                 prefer_grpc=False, qdrant_grpc_port=6334, registry=None, backend=None, max_length=512, vector_store=None):
         """
-        Initialize the Embbedingator with a model and Qdrant client.
+        Initialize the Embbedingator with a model and a vector store.
         Args:
             model_name (str): The Hugging Face model name for embedding generation.
             qdrant_host (str): Hostname for the Qdrant client.
             qdrant_port (int): Port for the Qdrant client.
+            use_cache (bool): Whether to reuse embeddings from the on-disk embedding cache.
+            prefer_grpc (bool): Whether to talk to Qdrant over gRPC instead of HTTP.
+            qdrant_grpc_port (int): gRPC port for the Qdrant client.
+            registry (ModelRegistry): Registry providing the shared model and client. Defaults to the process-wide one.
+            backend (str): Embedding backend ('transformers', 'int8' or 'onnx'). Defaults to EMBEDDING_BACKEND.
+            max_length (int): Default embedding window in tokens. Longer texts are truncated.
+            vector_store (str): Vector store receiving indexed chunks: 'qdrant', 'qdrant_local' or 'mmap'.
+                Defaults to VECTOR_STORE. The Qdrant settings only apply to 'qdrant'.
         """
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        self.qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
+        registry = registry or ModelRegistry.shared()
+        self.model_name = model_name
+        self.max_length = max_length
+        self.backend = resolve_backend(backend)
+        self.tokenizer, self.model = registry.get_model(model_name, self.backend)
+        self.embedding_cache = EmbeddingCache(cache_model_key(model_name, self.backend)) if use_cache else None
+        self.vector_store_name = resolve_vector_store(vector_store)
+        self.vector_store = registry.get_vector_store(
+            self.vector_store_name, host=qdrant_host, port=qdrant_port, grpc_port=qdrant_grpc_port, prefer_grpc=prefer_grpc
+        )
+        self._ready_collections = set()
+        # Tokens cut off by the embedding window, counted over every text embedded by this instance
+        self.truncation_stats = {"texts": 0, "truncated_texts": 0, "truncated_tokens": 0}
 
-    def initialize_qdrant_collection(self, collection_name, vector_size=384, distance="Cosine"):
+    def initialize_collection(self, collection_name, vector_size=384, refresh=False):
         """
-        Ensure the Qdrant collection exists. Create it if it does not exist.
+        Ensure the collection exists in the vector store. Create it if it does not exist.
+        The check is done once per collection; later calls return without contacting the store.
+        Vectors are compared by cosine similarity.
         Args:
             collection_name (str): Name of the collection to check or create.
             vector_size (int): The size of the vector embeddings.
-            distance (str): The distance metric for similarity search (e.g., 'Cosine', 'Euclid').
+            refresh (bool): Whether to check the store again even if the collection was seen before.
 
         Returns:
             None
         """
-        collections = self.qdrant_client.get_collections()
-        if collection_name not in [col.name for col in collections.collections]:
-            print(f"Creating Qdrant collection '{collection_name}'...")
-            self.qdrant_client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=distance)
-            )
+        if collection_name in self._ready_collections and not refresh:
+            return
+        if not self.vector_store.collection_exists(collection_name):
+            print(f"Creating collection '{collection_name}'...")
+            self.vector_store.create_collection(collection_name, vector_size)
             print(f"Collection '{collection_name}' created successfully.")
         else:
             print(f"Collection '{collection_name}' already exists.")
+        self._ready_collections.add(collection_name)
+
+    # Name from before the vector store interface, kept for existing callers
+    initialize_qdrant_collection = initialize_collection
 
     def embed_text(self, text):
         """
@@ -50,49 +76,207 @@ class Embbedingator:
         Returns:
             numpy.ndarray: The embedding vector.
         """
-        inputs = self.tokenizer(text, return_tensors="pt", max_length=512, truncation=True)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        return torch.mean(outputs.last_hidden_state, dim=1).squeeze().numpy()
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts, batch_size=32, max_length=None):
+        """
+        Compute embeddings for many texts with batched forward passes.
+        Texts are tokenized once, sorted by token length and grouped into
+        batches, so each batch is only padded up to its own longest text.
+        Padding is excluded from the mean pooling, which keeps every vector
+        identical to the one produced for the text on its own. Texts already
+        in the embedding cache skip model inference.
+        Args:
+            texts (list): The texts to embed.
+            batch_size (int): Number of texts per forward pass.
+            max_length (int): Maximum number of tokens kept per text. Defaults to the instance window.
+
+        Returns:
+            numpy.ndarray: Array of shape (len(texts), hidden_size), in input order.
+        """
+        max_length = max_length or self.max_length
+        embeddings = np.zeros((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        cached = self.embedding_cache.get_many(texts, max_length) if self.embedding_cache else {}
+        for i, vector in cached.items():
+            embeddings[i] = vector
+
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            embeddings[missing] = self._embed_batches(missing_texts, batch_size, max_length)
+            if self.embedding_cache:
+                self.embedding_cache.set_many(missing_texts, embeddings[missing], max_length)
+        return embeddings
+
+    def report_truncation(self):
+        """
+        Print how many tokens were cut off by the embedding window so far.
+        Returns:
+            dict: Number of embedded texts, truncated texts and truncated tokens.
+        """
+        stats = dict(self.truncation_stats)
+        if stats["truncated_texts"]:
+            per_chunk = stats["truncated_tokens"] / stats["truncated_texts"]
+            print(
+                f"Truncation: {stats['truncated_texts']} of {stats['texts']} chunks exceeded the {self.max_length}-token window, "
+                f"losing {stats['truncated_tokens']} tokens ({per_chunk:.1f} per truncated chunk)."
+            )
+        else:
+            print(f"Truncation: none of {stats['texts']} chunks exceeded the {self.max_length}-token window.")
+        return stats
 
-    def index_embedding(self, text, paper_id, collection_name="paper_chunks"):
+    def _embed_batches(self, texts, batch_size, max_length):
         """
-        Compute and index the embedding for a text chunk into Qdrant.
+        Run the model over texts in length-bucketed, dynamically padded batches.
+        Args:
+            texts (list): The texts to embed.
+            batch_size (int): Number of texts per forward pass.
+            max_length (int): Maximum number of tokens kept per text.
+
+        Returns:
+            numpy.ndarray: Array of shape (len(texts), hidden_size), in input order.
+        """
+        import torch
+
+        embeddings = np.zeros((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        # Tokenize without truncation so the tokens beyond the window can be counted,
+        # then cut each text the same way truncation=True would: keep the head and the final [SEP]
+        encodings = self.tokenizer(list(texts), verbose=False)
+        for i, input_ids in enumerate(encodings["input_ids"]):
+            overflow = len(input_ids) - max_length
+            if overflow > 0:
+                for key in encodings.keys():
+                    encodings[key][i] = encodings[key][i][:max_length - 1] + encodings[key][i][-1:]
+                self.truncation_stats["truncated_texts"] += 1
+                self.truncation_stats["truncated_tokens"] += overflow
+        self.truncation_stats["texts"] += len(texts)
+        lengths = [len(input_ids) for input_ids in encodings["input_ids"]]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            features = [{key: encodings[key][i] for key in encodings.keys()} for i in batch_indices]
+            inputs = self.tokenizer.pad(features, return_tensors="pt")
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+            mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            pooled = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            embeddings[batch_indices] = pooled.numpy()
+        return embeddings
+
+    @staticmethod
+    def point_id(paper_id, chunk_offset):
+        """
+        Derive a deterministic point ID for a chunk, so re-indexing a chunk overwrites its point.
+        Args:
+            paper_id (str): Identifier for the paper to which the chunk belongs.
+            chunk_offset (int): Position of the chunk within the paper.
+
+        Returns:
+            str: A UUID string that is stable across runs.
+        """
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{paper_id}#{chunk_offset}"))
+
+    def index_embedding(self, text, paper_id, collection_name="paper_chunks", chunk_offset=None):
+        """
+        Compute and index the embedding for a text chunk into the vector store.
         Args:
             text (str): The text chunk to embed.
             paper_id (str): Identifier for the paper to which the chunk belongs.
-            collection_name (str): Name of the Qdrant collection.
+            collection_name (str): Name of the collection.
+            chunk_offset (int): Position of the chunk within the paper. When omitted, the ID is
+                derived from the chunk text so indexing the same chunk twice still yields one point.
 
         Returns:
             None
         """
         # Ensure the collection exists
-        self.initialize_qdrant_collection(collection_name)
+        self.initialize_collection(collection_name, vector_size=self.model.config.hidden_size)
 
         # Generate embedding
         embedding = self.embed_text(text)
 
-        # Generate a unique chunk ID
-        chunk_id = str(uuid.uuid4())
-
-        # Upsert into Qdrant
-        self.qdrant_client.upsert(
-            collection_name=collection_name,
-            points=[
-                PointStruct(
-                    id=chunk_id,
-                    vector=embedding.tolist(),
-                    payload={
-                        "paper_id": paper_id,
-                        "chunk_text": text,
-                        "chunk_id": chunk_id
-                    }
-                )
-            ]
+        # Generate a deterministic chunk ID
+        if chunk_offset is None:
+            chunk_offset = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        chunk_id = self.point_id(paper_id, chunk_offset)
+
+        # Upsert into the vector store
+        self.vector_store.upsert(
+            collection_name,
+            [chunk_id],
+            [embedding],
+            [{
+                "paper_id": paper_id,
+                "chunk_text": text,
+                "chunk_id": chunk_id
+            }]
         )
         print(f"Indexed chunk for paper '{paper_id}' with chunk ID: {chunk_id}")
 
 
+    def index_embeddings(self, texts, paper_ids, collection_name="paper_chunks", chunk_offsets=None,
+                         upsert_batch_size=256, embed_batch_size=32):
+        """
+        Compute and index embeddings for many text chunks with batched writes.
+        Points are upserted in batches of upsert_batch_size. While one batch is being written to the vector store
+        the next one is already being embedded, so model inference and I/O overlap.
+        Args:
+            texts (list): The text chunks to embed.
+            paper_ids (list): Identifier of the paper each chunk belongs to.
+            collection_name (str): Name of the collection.
+            chunk_offsets (list): Position of each chunk within its paper. When omitted, IDs are
+                derived from the chunk text, as in index_embedding.
+            upsert_batch_size (int): Number of points per upsert request.
+            embed_batch_size (int): Number of texts per model forward pass.
+
+        Returns:
+            list: The point ID of every chunk, in input order.
+        """
+        if len(texts) != len(paper_ids):
+            raise ValueError("texts and paper_ids must have the same length.")
+        if chunk_offsets is not None and len(chunk_offsets) != len(texts):
+            raise ValueError("chunk_offsets must have the same length as texts.")
+        self.initialize_collection(collection_name, vector_size=self.model.config.hidden_size)
+
+        point_ids = []
+        pending_upsert = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for start in range(0, len(texts), upsert_batch_size):
+                batch_texts = texts[start:start + upsert_batch_size]
+                vectors = self.embed_texts(batch_texts, batch_size=embed_batch_size)
+
+                batch_ids, payloads = [], []
+                for i, (text, vector) in enumerate(zip(batch_texts, vectors), start=start):
+                    payload = {"paper_id": paper_ids[i], "chunk_text": text}
+                    if chunk_offsets is None:
+                        chunk_offset = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                    else:
+                        chunk_offset = chunk_offsets[i]
+                        payload["chunk_offset"] = chunk_offset
+                    chunk_id = self.point_id(paper_ids[i], chunk_offset)
+                    payload["chunk_id"] = chunk_id
+                    batch_ids.append(chunk_id)
+                    payloads.append(payload)
+                    point_ids.append(chunk_id)
+
+                # Keep at most one write in flight before handing over the next batch
+                if pending_upsert is not None:
+                    pending_upsert.result()
+                pending_upsert = executor.submit(
+                    self.vector_store.upsert, collection_name, batch_ids, vectors, payloads
+                )
+
+            if pending_upsert is not None:
+                pending_upsert.result()
+
+        print(f"Indexed {len(point_ids)} chunks into '{collection_name}'.")
+        return point_ids
+
+
 if __name__ == "__main__":
     # Example standalone usage
     print("Testing Embbedingator functionality...")
@@ -0,0 +1,176 @@
+import os
+from types import SimpleNamespace
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+
+# "transformers": eager fp32 PyTorch, "int8": dynamically quantized Linear layers, "onnx": exported ONNX Runtime model
+BACKENDS = ("transformers", "int8", "onnx")
+
+
+def resolve_backend(backend=None):
+    """
+    Pick the embedding backend from an explicit value or the EMBEDDING_BACKEND environment variable.
+    Args:
+        backend (str): Requested backend. None falls back to EMBEDDING_BACKEND, then to 'transformers'.
+
+    Returns:
+        str: The backend name.
+
+    Raises:
+        ValueError: If the backend is not supported.
+    """
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "transformers")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported embedding backend '{backend}'. Choose one of {BACKENDS}.")
+    return backend
+
+
+def cache_model_key(model_name, backend):
+    """
+    Name under which a model's embeddings are cached. Other backends get their own entries,
+    since their vectors differ slightly from the fp32 ones.
+    Args:
+        model_name (str): The Hugging Face model name.
+        backend (str): The embedding backend.
+
+    Returns:
+        str: The model key for EmbeddingCache.
+    """
+    return model_name if backend == "transformers" else f"{model_name}@{backend}"
+
+
+def configure_threads(num_threads=None):
+    """
+    Set the number of intra-op threads used by PyTorch inference.
+    Args:
+        num_threads (int): Number of threads. None falls back to EMBEDDING_THREADS, and leaves
+            the PyTorch default untouched when that is not set either.
+
+    Returns:
+        int: The configured number of threads, or None if the default was kept.
+    """
+    num_threads = num_threads or os.getenv("EMBEDDING_THREADS")
+    if not num_threads:
+        return None
+    import torch
+
+    torch.set_num_threads(int(num_threads))
+    return int(num_threads)
+
+
+def build_encoder(model, tokenizer, model_name, backend, cache_dir=None):
+    """
+    Turn a loaded transformers model into an encoder for the requested backend.
+    Every encoder is called like the transformers model and returns an object with a last_hidden_state tensor,
+    so the pooling code of the callers does not depend on the backend.
+    Args:
+        model (transformers.PreTrainedModel): The fp32 model.
+        tokenizer (transformers.PreTrainedTokenizer): Its tokenizer, used to trace the ONNX export.
+        model_name (str): The Hugging Face model name.
+        backend (str): One of BACKENDS.
+        cache_dir (str): Folder holding exported ONNX models. Defaults to .cache/onnx in the repository.
+
+    Returns:
+        object: The encoder.
+    """
+    if backend == "transformers":
+        return model
+    if backend == "int8":
+        import torch
+
+        quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        quantized.eval()
+        return quantized
+
+    onnx_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR / "onnx", model_name.replace("/", "__"))
+    onnx_path = os.path.join(onnx_dir, "model.onnx")
+    if not os.path.exists(onnx_path):
+        OnnxEncoder.export(model, tokenizer, onnx_path)
+    return OnnxEncoder(onnx_path, model.config)
+
+
+class OnnxEncoder:
+    def __init__(self, onnx_path, config, num_threads=None):
+        """
+        Initialize an ONNX Runtime session for an exported encoder.
+        Args:
+            onnx_path (str): Path to the exported model.
+            config (transformers.PretrainedConfig): Config of the original model, kept for hidden_size.
+            num_threads (int): Intra-op threads for ONNX Runtime. Defaults to EMBEDDING_THREADS, then to the runtime default.
+        """
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The 'onnx' embedding backend requires the onnxruntime package.") from e
+
+        options = onnxruntime.SessionOptions()
+        num_threads = num_threads or os.getenv("EMBEDDING_THREADS")
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.config = config
+
+    @staticmethod
+    def export(model, tokenizer, onnx_path):
+        """
+        Export a transformers encoder to ONNX with dynamic batch and sequence axes.
+        Args:
+            model (transformers.PreTrainedModel): The fp32 model.
+            tokenizer (transformers.PreTrainedTokenizer): Its tokenizer, used to build the example input.
+            onnx_path (str): Destination of the exported model.
+        """
+        import torch
+
+        print(f"Exporting embedding model to '{onnx_path}'...")
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        example = tokenizer(["An example sentence.", "Another one."], padding=True, return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in example]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        class LastHiddenState(torch.nn.Module):
+            # Fixes the positional input order and returns a single tensor, which the tracer needs
+            def __init__(self):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *args):
+                return self.model(**dict(zip(input_names, args))).last_hidden_state
+
+        # Write under a temporary name so an interrupted export is never picked up
+        temp_path = f"{onnx_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState(),
+                tuple(example[name] for name in input_names),
+                temp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                dynamo=False
+            )
+        os.replace(temp_path, onnx_path)
+
+    def __call__(self, **inputs):
+        """
+        Run the encoder on tokenized inputs.
+        Args:
+            **inputs: Tokenizer outputs as PyTorch tensors.
+
+        Returns:
+            SimpleNamespace: Object with a last_hidden_state tensor, like a transformers model output.
+        """
+        import torch
+
+        feed = {name: inputs[name].numpy() for name in self.input_names}
+        last_hidden_state = self.session.run(["last_hidden_state"], feed)[0]
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(last_hidden_state))
+
+    def eval(self):
+        """
+        No-op kept for compatibility with transformers models.
+        Returns:
+            OnnxEncoder: This encoder.
+        """
+        return self
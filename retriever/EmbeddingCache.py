@@ -0,0 +1,83 @@
+import hashlib
+import numpy as np
+from retriever.DiskCache import DiskCache, DEFAULT_CACHE_DIR
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, path=None, max_entries=200000):
+        """
+        Initialize a content-addressed embedding cache for one embedding model.
+        Vectors are keyed by the model name, the tokenizer max_length and a SHA-256 hash of the text,
+        so an unchanged chunk is never embedded twice by the same model and window.
+        Args:
+            model_name (str): Name of the model producing the embeddings.
+            path (str): Path to the SQLite cache file. Defaults to .cache/embeddings.sqlite in the repository.
+            max_entries (int): Maximum number of vectors kept on disk before LRU eviction.
+        """
+        self.model_name = model_name
+        self.store = DiskCache(path or DEFAULT_CACHE_DIR / "embeddings.sqlite", max_entries=max_entries)
+
+    def key(self, text, max_length):
+        """
+        Build the cache key for a text.
+        Args:
+            text (str): The embedded text.
+            max_length (int): Tokenizer max_length used for the embedding.
+
+        Returns:
+            str: The cache key.
+        """
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}|{max_length}|{text_hash}"
+
+    def get_many(self, texts, max_length):
+        """
+        Look up cached embeddings for several texts.
+        Args:
+            texts (list): Texts to look up.
+            max_length (int): Tokenizer max_length used for the embeddings.
+
+        Returns:
+            dict: Mapping from the position of each cached text in texts to its embedding vector.
+        """
+        keys = [self.key(text, max_length) for text in texts]
+        found = self.store.get_many(keys)
+        return {
+            i: np.frombuffer(found[key], dtype=np.float32).copy()
+            for i, key in enumerate(keys) if key in found
+        }
+
+    def get(self, text, max_length):
+        """
+        Look up the cached embedding for a single text.
+        Args:
+            text (str): Text to look up.
+            max_length (int): Tokenizer max_length used for the embedding.
+
+        Returns:
+            numpy.ndarray: The embedding vector, or None when it is not cached.
+        """
+        return self.get_many([text], max_length).get(0)
+
+    def set_many(self, texts, vectors, max_length):
+        """
+        Store embeddings for several texts.
+        Args:
+            texts (list): The embedded texts.
+            vectors (numpy.ndarray): One embedding per text.
+            max_length (int): Tokenizer max_length used for the embeddings.
+        """
+        self.store.set_many({
+            self.key(text, max_length): np.asarray(vector, dtype=np.float32).tobytes()
+            for text, vector in zip(texts, vectors)
+        })
+
+    def set(self, text, vector, max_length):
+        """
+        Store the embedding for a single text.
+        Args:
+            text (str): The embedded text.
+            vector (numpy.ndarray): Its embedding.
+            max_length (int): Tokenizer max_length used for the embedding.
+        """
+        self.set_many([text], [vector], max_length)
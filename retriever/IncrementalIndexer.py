@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from retriever.Chunkenizer import Chunkenizer
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+from retriever.Embbedingator import Embbedingator
+from retriever.EmbeddingBackend import cache_model_key
+from retriever.KeywordIndex import KeywordIndex
+
+# One lock per state file, shared by every indexer of the process, so concurrent jobs merge their fingerprints
+_state_locks = {}
+_state_locks_guard = threading.Lock()
+
+
+def _state_lock(state_file):
+    """
+    Get the process-wide lock of a state file.
+    Args:
+        state_file (Path): Path to the state file.
+
+    Returns:
+        threading.Lock: The lock guarding load-merge-save of the file.
+    """
+    key = os.path.abspath(state_file)
+    with _state_locks_guard:
+        return _state_locks.setdefault(key, threading.Lock())
+
+
+class IncrementalIndexer:
+    def __init__(self, chunkenizer, embbedingator, collection_name="paper_chunks", state_file=None, batch_size=64, keyword_index=None):
+        """
+        Initialize an indexer that keeps a vector store collection in sync with a local corpus.
+        Only new or modified papers are chunked, embedded and upserted. Points use deterministic IDs
+        derived from the paper path and chunk offset, so re-indexing overwrites instead of duplicating.
+        Args:
+            chunkenizer (Chunkenizer): Chunkenizer used to extract and split the papers.
+            embbedingator (Embbedingator): Embbedingator used to embed chunks and reach the vector store.
+            collection_name (str): Name of the collection.
+            state_file (str): JSON file holding the fingerprint of every indexed paper.
+                Defaults to .cache/index_state_<collection_name>.json in the repository, with the name of the
+                vector store appended for stores other than the Qdrant server.
+            batch_size (int): Number of chunks upserted per request.
+            keyword_index (KeywordIndex): If given, the keywords of new or modified papers are extracted into it.
+        """
+        self.chunkenizer = chunkenizer
+        self.embbedingator = embbedingator
+        self.vector_store = embbedingator.vector_store
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.keyword_index = keyword_index
+        if state_file is None:
+            store_suffix = "" if embbedingator.vector_store_name == "qdrant" else f"_{embbedingator.vector_store_name}"
+            state_file = DEFAULT_CACHE_DIR / f"index_state_{collection_name}{store_suffix}.json"
+        self.state_file = Path(state_file)
+        self.state = self._load_state()
+        # Papers whose modification time changed without a change of content, saved with the next state update
+        self._touched = {}
+        # Vectors of another model or backend do not match the query embeddings, so they are re-indexed
+        self.embedding_signature = cache_model_key(embbedingator.model_name, embbedingator.backend)
+
+    def _load_state(self):
+        """
+        Load the fingerprints of the papers already in the collection.
+        Returns:
+            dict: Mapping from paper ID to its fingerprint and number of chunks.
+        """
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, changes=None, reset=False):
+        """
+        Merge fingerprint changes into the state file and reload it, so indexers of concurrent jobs
+        do not drop each other's papers. The file is written under a temporary name and then renamed.
+        Args:
+            changes (dict): Mapping from paper ID to its new fingerprint, or None for a removed paper.
+            reset (bool): Whether to discard every fingerprint on disk before merging.
+        """
+        with _state_lock(self.state_file):
+            state = {} if reset else self._load_state()
+            for paper_id, entry in (changes or {}).items():
+                if entry is None:
+                    state.pop(paper_id, None)
+                else:
+                    state[paper_id] = entry
+            os.makedirs(self.state_file.parent, exist_ok=True)
+            temp_file = self.state_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=4)
+            os.replace(temp_file, self.state_file)
+            self.state = state
+
+    def _content_hash(self, file_path):
+        """
+        Hash the content of a file.
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            str: SHA-256 hex digest of the file bytes.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_current(self, file_path):
+        """
+        Check whether a paper is indexed in its current version, with the current chunking settings and embedding model.
+        Size and modification time are compared first; the content hash is only computed when they differ,
+        so touching a file without changing it does not trigger re-embedding.
+        Args:
+            file_path (str): Path to the paper.
+
+        Returns:
+            bool: True if the indexed chunks match the file on disk.
+        """
+        entry = self.state.get(file_path)
+        if entry is None or entry.get("chunking") != self.chunkenizer.signature:
+            return False
+        if entry.get("embedding") != self.embedding_signature:
+            return False
+        stat = os.stat(file_path)
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        if entry["size"] == stat.st_size and entry["sha256"] == self._content_hash(file_path):
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._touched[file_path] = entry
+            return True
+        return False
+
+    def index_papers(self, file_paths, prune_folder=None):
+        """
+        Embed and upsert the chunks of new or modified papers.
+        Args:
+            file_paths (list): Paths of the papers that should be in the collection. Each path is used as the paper ID.
+            prune_folder (str): If given, indexed papers from this folder that are not in file_paths
+                are treated as removed and their points are deleted.
+
+        Returns:
+            dict: Lists of the indexed, unchanged and removed paper IDs.
+        """
+        # Pick up the papers indexed by other jobs since this indexer was built
+        self.state = self._load_state()
+        if not self.vector_store.collection_exists(self.collection_name):
+            # A fresh collection holds none of the papers recorded in the state file
+            self._save_state(reset=True)
+        elif self.state and self.vector_store.count(self.collection_name) == 0:
+            # The collection was wiped and recreated outside of the indexer
+            self._save_state(reset=True)
+        self.embbedingator.initialize_collection(
+            self.collection_name, vector_size=self.embbedingator.model.config.hidden_size, refresh=True
+        )
+
+        file_paths = list(dict.fromkeys(file_paths))
+        changed = [path for path in file_paths if not self.is_current(path)]
+        unchanged = [path for path in file_paths if path not in changed]
+
+        removed = []
+        if prune_folder is not None:
+            wanted = set(file_paths)
+            folder = os.path.abspath(prune_folder)
+            removed = [
+                paper_id for paper_id in self.state
+                if paper_id not in wanted and os.path.dirname(os.path.abspath(paper_id)) == folder
+            ]
+        for paper_id in removed:
+            self._delete_paper(paper_id)
+            self._save_state({paper_id: None})
+            print(f"Removed points for deleted paper '{paper_id}'")
+
+        for paper_id, chunks in self.chunkenizer.process_files(changed):
+            self._upsert_paper(paper_id, chunks)
+            stat = os.stat(paper_id)
+            # Save after every paper so an interrupted run keeps its progress
+            self._save_state({paper_id: {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": self._content_hash(paper_id),
+                "num_chunks": len(chunks),
+                "chunking": self.chunkenizer.signature,
+                "embedding": self.embedding_signature
+            }})
+            print(f"Indexed {len(chunks)} chunks for paper '{paper_id}'")
+
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._save_state(touched)
+        if changed:
+            self.embbedingator.report_truncation()
+        if changed and self.keyword_index is not None:
+            # Text extraction is cached by the chunking above, so this only runs keyword extraction
+            self.keyword_index.index_files(changed, pdf_text_store=self.chunkenizer.pdf_text_store)
+        print(f"Indexing done: {len(changed)} indexed, {len(unchanged)} unchanged, {len(removed)} removed.")
+        return {"indexed": changed, "unchanged": unchanged, "removed": removed}
+
+    def index_folder(self, folder=None):
+        """
+        Bring the collection in sync with every supported file in a folder, deleting papers that left it.
+        Args:
+            folder (str): Folder to index. Defaults to the Chunkenizer's papers folder.
+
+        Returns:
+            dict: Lists of the indexed, unchanged and removed paper IDs.
+        """
+        folder = folder or self.chunkenizer.papers_folder
+        return self.index_papers(self.chunkenizer.list_files(folder), prune_folder=folder)
+
+    def _upsert_paper(self, paper_id, chunks):
+        """
+        Embed and upsert the chunks of one paper, and delete points left over from a longer previous version.
+        Args:
+            paper_id (str): Identifier of the paper.
+            chunks (list): Text chunks of the paper, in order.
+        """
+        self.embbedingator.index_embeddings(
+            chunks,
+            [paper_id] * len(chunks),
+            collection_name=self.collection_name,
+            chunk_offsets=list(range(len(chunks))),
+            upsert_batch_size=self.batch_size
+        )
+
+        previous_chunks = self.state.get(paper_id, {}).get("num_chunks", 0)
+        if previous_chunks > len(chunks):
+            stale_ids = [Embbedingator.point_id(paper_id, offset) for offset in range(len(chunks), previous_chunks)]
+            self.vector_store.delete_ids(self.collection_name, stale_ids)
+
+    def _delete_paper(self, paper_id):
+        """
+        Delete every point of a paper.
+        Args:
+            paper_id (str): Identifier of the paper.
+        """
+        self.vector_store.delete_paper(self.collection_name, paper_id)
+
+
+if __name__ == "__main__":
+    # Example standalone usage
+    print("Testing IncrementalIndexer functionality...")
+
+    folder = input("Enter the path to your papers folder: ").strip()
+    embbedingator = Embbedingator()
+    indexer = IncrementalIndexer(
+        Chunkenizer(folder, tokenizer_name=embbedingator.model_name), embbedingator, keyword_index=KeywordIndex()
+    )
+    summary = indexer.index_folder(folder)
+    print(f"Indexed: {summary['indexed']}")
+    print(f"Unchanged: {len(summary['unchanged'])} papers")
+    print(f"Removed: {summary['removed']}")
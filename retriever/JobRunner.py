@@ -0,0 +1,221 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from retriever.ModelRegistry import ModelRegistry
+from retriever.PipelineEvents import PipelineFinished
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while every worker is busy and the queue is full."""
+
+
+class Job:
+    def __init__(self, user_inputs):
+        """
+        Initialize the state of one pipeline run submitted to the JobRunner.
+        Args:
+            user_inputs (dict): Inputs of the run, as accepted by Coordinator.
+        """
+        self.job_id = uuid.uuid4().hex
+        self.user_inputs = user_inputs
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.run_id = None
+        self.memo_path = None
+        self.error = None
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add_event(self, event):
+        """
+        Record an event emitted by the pipeline.
+        Args:
+            event (object): Event of PipelineEvents.
+        """
+        with self._lock:
+            self.events.append(event)
+
+    def events_since(self, cursor):
+        """
+        Get the events recorded after a given position.
+        Args:
+            cursor (int): Number of events the caller has already seen.
+
+        Returns:
+            list: The new events.
+        """
+        with self._lock:
+            return self.events[cursor:]
+
+
+class JobRunner:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_workers=2, max_queued=8, max_finished=100, registry=None):
+        """
+        Initialize a local runner that executes pipeline jobs on a bounded worker pool.
+        Every job builds its own Coordinator from its own inputs and writes into its own run directory,
+        so concurrent users never share files. Jobs beyond the free workers wait in a bounded queue,
+        and submissions beyond that are rejected instead of overloading the machine.
+        Args:
+            max_workers (int): Number of pipelines that run at the same time.
+            max_queued (int): Number of jobs that may wait for a worker.
+            max_finished (int): Number of finished jobs kept for status queries.
+            registry (ModelRegistry): Registry shared by all jobs. Defaults to the process-wide registry.
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.registry = registry or ModelRegistry.shared()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-job")
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Get the process-wide job runner.
+        Returns:
+            JobRunner: The runner shared by every UI session.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def submit(self, user_inputs):
+        """
+        Queue a pipeline run.
+        Args:
+            user_inputs (dict): Inputs of the run, as accepted by Coordinator.
+
+        Returns:
+            str: ID of the job, used to poll its status and events.
+
+        Raises:
+            JobQueueFull: If all workers are busy and max_queued jobs are already waiting.
+        """
+        with self._lock:
+            active = sum(1 for job in self.jobs.values() if job.state in ("queued", "running"))
+            if active >= self.max_workers + self.max_queued:
+                raise JobQueueFull(f"{active} jobs are already running or queued. Please try again later.")
+            job = Job(dict(user_inputs))
+            self.jobs[job.job_id] = job
+            self._forget_finished_jobs()
+        self.executor.submit(self._run, job)
+        return job.job_id
+
+    def _run(self, job):
+        """
+        Execute a job in a worker thread and record its outcome.
+        Args:
+            job (Job): The job to run.
+        """
+        # The pipeline pulls in the embedding stack, so it is imported when the first job runs
+        from retriever.coordinator import Coordinator
+
+        with self._lock:
+            job.state = "running"
+            job.started_at = time.time()
+        try:
+            coordinator = Coordinator(user_inputs=job.user_inputs, registry=self.registry)
+            job.run_id = coordinator.manifest.run_id
+            memo_path = coordinator.run_pipeline(event_output=job.add_event)
+            job.memo_path = str(memo_path) if memo_path else None
+            job.add_event(PipelineFinished(run_id=job.run_id, memo_path=job.memo_path))
+            state = "completed"
+        except Exception as e:
+            print(f"Job {job.job_id} failed: {e}")
+            job.error = str(e)
+            # run_pipeline records the failure in the run manifest
+            state = "failed"
+        with self._lock:
+            job.state = state
+            job.finished_at = time.time()
+
+    def _forget_finished_jobs(self):
+        """
+        Drop the oldest finished jobs beyond max_finished. Must be called with the lock held.
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def status(self, job_id):
+        """
+        Get the status of a job.
+        Args:
+            job_id (str): ID returned by submit().
+
+        Returns:
+            dict: State ('queued', 'running', 'completed' or 'failed'), position in the queue, run ID,
+                memo path, error and number of events so far.
+
+        Raises:
+            KeyError: If the job is unknown.
+        """
+        with self._lock:
+            job = self.jobs[job_id]
+            queued = [queued_id for queued_id, queued_job in self.jobs.items() if queued_job.state == "queued"]
+            return {
+                "job_id": job.job_id,
+                "state": job.state,
+                "queue_position": queued.index(job_id) + 1 if job.state == "queued" else 0,
+                "run_id": job.run_id,
+                "memo_path": job.memo_path,
+                "error": job.error,
+                "num_events": len(job.events)
+            }
+
+    def poll(self, job_id, cursor=0):
+        """
+        Get the events of a job that the caller has not seen yet, together with its status.
+        Args:
+            job_id (str): ID returned by submit().
+            cursor (int): Number of events the caller has already seen.
+
+        Returns:
+            tuple: The new events, the cursor to pass to the next call and the status of the job.
+
+        Raises:
+            KeyError: If the job is unknown.
+        """
+        # Read the status first: once it reports a finished job, every event of that job is already recorded
+        status = self.status(job_id)
+        events = self.jobs[job_id].events_since(cursor)
+        return events, cursor + len(events), status
+
+    def is_finished(self, job_id):
+        """
+        Check whether a job has completed or failed.
+        Args:
+            job_id (str): ID returned by submit().
+
+        Returns:
+            bool: True once the job is no longer queued or running.
+        """
+        return self.status(job_id)["state"] in ("completed", "failed")
+
+
+if __name__ == "__main__":
+    print("Testing JobRunner functionality...")
+
+    runner = JobRunner(max_workers=1, max_queued=1)
+    job_id = runner.submit({
+        "query": "Effect of mobile banking on financial inclusion of women",
+        "option": "1",
+        "papers_folder": "papers",
+        "local_papers": []
+    })
+    cursor = 0
+    while not runner.is_finished(job_id):
+        events, cursor, status = runner.poll(job_id, cursor)
+        for event in events:
+            print(event)
+        time.sleep(1)
+    print(f"Final status: {runner.status(job_id)}")
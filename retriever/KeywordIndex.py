@@ -0,0 +1,218 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from retriever.DiskCache import DiskCache, DEFAULT_CACHE_DIR
+
+# YAKE extractor built once per process by extract_keywords
+_keyword_extractor = None
+# Default cap on extraction processes, since every concurrent pipeline job starts its own pool
+MAX_WORKERS = 4
+
+
+def extract_keywords(text, top_k=5):
+    """
+    Extract the key phrases of a text with YAKE.
+    Args:
+        text (str): The text.
+        top_k (int): Number of key phrases to return.
+
+    Returns:
+        list: The best key phrases, best first, or a placeholder when none can be extracted.
+    """
+    global _keyword_extractor
+    if not text or len(text.strip()) == 0:
+        return ["no_keywords_found"]
+    try:
+        if _keyword_extractor is None:
+            import yake
+
+            _keyword_extractor = yake.KeywordExtractor()
+        keywords = _keyword_extractor.extract_keywords(text)
+        keywords = sorted(keywords, key=lambda x: x[1])[:top_k]
+        return [kw[0] for kw in keywords]
+    except Exception as e:
+        print(f"Error extracting keywords: {e}")
+        return ["keyword_extraction_failed"]
+
+
+class KeywordIndex:
+    def __init__(self, path=None, top_k=5, max_entries=100000):
+        """
+        Initialize a persistent index of the keywords of every paper.
+        Keywords are extracted once per paper version when papers are ingested and stored under a SHA-256 hash
+        of the paper text, so question generation only looks them up. The latest version of each paper
+        is also recorded under its ID.
+        Args:
+            path (str): Path to the SQLite file. Defaults to .cache/keywords.sqlite in the repository.
+            top_k (int): Number of keywords kept per paper.
+            max_entries (int): Maximum number of entries kept on disk before LRU eviction.
+        """
+        self.top_k = top_k
+        self.store = DiskCache(path or DEFAULT_CACHE_DIR / "keywords.sqlite", max_entries=max_entries)
+
+    @staticmethod
+    def content_hash(text):
+        """
+        Hash the text of a paper.
+        Args:
+            text (str): The text.
+
+        Returns:
+            str: SHA-256 hex digest of the text.
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _content_key(self, content_hash):
+        """
+        Build the key of the keywords of a paper version.
+        Args:
+            content_hash (str): Hash returned by content_hash().
+
+        Returns:
+            str: The key, which includes the extraction settings.
+        """
+        return f"yake:{self.top_k}|{content_hash}"
+
+    @staticmethod
+    def _paper_key(paper_id):
+        """
+        Build the key recording the latest indexed version of a paper.
+        Args:
+            paper_id (str): ID of the paper.
+
+        Returns:
+            str: The key.
+        """
+        return f"paper|{paper_id}"
+
+    def index_texts(self, texts_by_paper, max_workers=None):
+        """
+        Extract and store the keywords of papers that are not indexed in their current version.
+        Extraction is spread across a pool of spawned processes, since forking a process that already runs
+        torch or pipeline threads can deadlock the children. A single paper, or max_workers=1, is processed in
+        the current process.
+        Args:
+            texts_by_paper (dict): Mapping from paper ID to its full text.
+            max_workers (int): Number of worker processes. Defaults to the number of CPUs, at most MAX_WORKERS.
+
+        Returns:
+            dict: Number of papers indexed and already present.
+        """
+        hashes = {
+            paper_id: self.content_hash(text)
+            for paper_id, text in texts_by_paper.items() if text and text.strip()
+        }
+        found = self.store.get_many([self._content_key(content_hash) for content_hash in hashes.values()])
+        missing = {}
+        for paper_id, content_hash in hashes.items():
+            if self._content_key(content_hash) not in found:
+                missing.setdefault(content_hash, texts_by_paper[paper_id])
+
+        items = {}
+        texts = list(missing.values())
+        if max_workers is None:
+            max_workers = min(MAX_WORKERS, os.cpu_count() or 1)
+        max_workers = min(max_workers, len(texts))
+        if max_workers <= 1:
+            results = [extract_keywords(text, self.top_k) for text in texts]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results = list(executor.map(extract_keywords, texts, [self.top_k] * len(texts)))
+        for content_hash, keywords in zip(missing, results):
+            if keywords != ["keyword_extraction_failed"]:
+                items[self._content_key(content_hash)] = json.dumps(keywords).encode("utf-8")
+        for paper_id, content_hash in hashes.items():
+            items[self._paper_key(paper_id)] = content_hash.encode("utf-8")
+        self.store.set_many(items)
+        return {"indexed": len(missing), "unchanged": len(hashes) - len(missing)}
+
+    def index_files(self, file_paths, pdf_text_store=None, max_workers=None):
+        """
+        Extract and store the keywords of PDF and TXT files, using each path as the paper ID.
+        Args:
+            file_paths (list): Paths of the papers.
+            pdf_text_store (PdfTextStore): Store providing the extracted PDF text. A new one is created if omitted.
+            max_workers (int): Number of worker processes. Defaults to the number of CPUs, at most MAX_WORKERS.
+
+        Returns:
+            dict: Number of papers indexed and already present.
+        """
+        if pdf_text_store is None:
+            from retriever.PdfTextStore import PdfTextStore
+
+            pdf_text_store = PdfTextStore()
+        texts_by_paper = {}
+        for file_path in file_paths:
+            try:
+                if os.path.splitext(file_path)[1].lower() == ".pdf":
+                    texts_by_paper[file_path] = pdf_text_store.get_text(file_path)
+                else:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        texts_by_paper[file_path] = f.read()
+            except (FileNotFoundError, UnicodeDecodeError) as e:
+                print(f"Skipping keywords of '{file_path}': {e}")
+        return self.index_texts(texts_by_paper, max_workers=max_workers)
+
+    def get(self, paper_id):
+        """
+        Get the keywords of the latest indexed version of a paper.
+        Args:
+            paper_id (str): ID of the paper.
+
+        Returns:
+            list: The keywords, or None if the paper is not indexed.
+        """
+        content_hash = self.store.get(self._paper_key(paper_id))
+        if content_hash is None:
+            return None
+        value = self.store.get(self._content_key(content_hash.decode("utf-8")))
+        return json.loads(value) if value is not None else None
+
+    def lookup(self, paper_id, text):
+        """
+        Get the keywords of a paper in the given version. A paper that was not indexed at ingestion is
+        indexed now.
+        Args:
+            paper_id (str): ID of the paper.
+            text (str): Full text of the paper.
+
+        Returns:
+            list: The keywords.
+        """
+        if not text or not text.strip():
+            return extract_keywords(text, self.top_k)
+        content_hash = self.content_hash(text)
+        value = self.store.get(self._content_key(content_hash))
+        if value is not None:
+            return json.loads(value)
+        print(f"Keywords of '{paper_id}' were not indexed, extracting them now")
+        keywords = extract_keywords(text, self.top_k)
+        items = {self._paper_key(paper_id): content_hash.encode("utf-8")}
+        if keywords != ["keyword_extraction_failed"]:
+            items[self._content_key(content_hash)] = json.dumps(keywords).encode("utf-8")
+        self.store.set_many(items)
+        return keywords
+
+    def stats(self):
+        """
+        Get hit and miss counters of the lookups.
+        Returns:
+            dict: Number of hits, misses and the hit rate.
+        """
+        return self.store.stats()
+
+
+if __name__ == "__main__":
+    print("Testing KeywordIndex functionality...")
+
+    folder = input("Enter the path to your papers folder: ").strip()
+    file_paths = [
+        os.path.join(folder, name) for name in sorted(os.listdir(folder))
+        if name.lower().endswith((".pdf", ".txt"))
+    ]
+    keyword_index = KeywordIndex()
+    print(keyword_index.index_files(file_paths))
+    for file_path in file_paths:
+        print(f"{file_path}: {keyword_index.get(file_path)}")
@@ -0,0 +1,166 @@
+import threading
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+from retriever.EmbeddingBackend import build_encoder, configure_threads
+from retriever.VectorStore import MmapVectorStore, QdrantVectorStore, resolve_vector_store
+
+
+class ModelRegistry:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Initialize a registry of loaded models, Qdrant clients and vector stores.
+        Every tokenizer/model pair, client and store is created at most once and then shared
+        by all components that ask for it, so the pipeline does not reload weights for each stage or run.
+        """
+        self._models = {}
+        self._tokenizers = {}
+        self._qdrant_clients = {}
+        self._vector_stores = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Get the process-wide registry.
+        Returns:
+            ModelRegistry: The registry shared by every component that is not given one explicitly.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get_model(self, model_name, backend="transformers"):
+        """
+        Get the tokenizer and encoder for a Hugging Face model name, loading them on first use.
+        The model is put in evaluation mode; callers only run inference with it.
+        Args:
+            model_name (str): The Hugging Face model name.
+            backend (str): Embedding backend of the encoder, one of EmbeddingBackend.BACKENDS.
+
+        Returns:
+            tuple: The tokenizer and the encoder.
+        """
+        key = (model_name, backend)
+        with self._lock:
+            if key not in self._models:
+                # transformers pulls in torch, so it is only imported once a model is actually needed
+                from transformers import AutoModel, AutoTokenizer
+
+                configure_threads()
+                base_key = (model_name, "transformers")
+                if base_key in self._models:
+                    tokenizer, model = self._models[base_key]
+                else:
+                    print(f"Loading model '{model_name}'...")
+                    tokenizer = self._tokenizers.get(model_name) or AutoTokenizer.from_pretrained(model_name)
+                    model = AutoModel.from_pretrained(model_name)
+                    model.eval()
+                encoder = build_encoder(model, tokenizer, model_name, backend)
+                self._models[key] = (tokenizer, encoder)
+            return self._models[key]
+
+    def get_tokenizer(self, model_name):
+        """
+        Get the tokenizer of a Hugging Face model name without loading the model, loading it on first use.
+        The tokenizer of a model already loaded by get_model() is reused.
+        Args:
+            model_name (str): The Hugging Face model name.
+
+        Returns:
+            PreTrainedTokenizer: The shared tokenizer.
+        """
+        with self._lock:
+            if model_name not in self._tokenizers:
+                loaded = [tokenizer for (name, _), (tokenizer, _) in self._models.items() if name == model_name]
+                if loaded:
+                    self._tokenizers[model_name] = loaded[0]
+                else:
+                    from transformers import AutoTokenizer
+
+                    self._tokenizers[model_name] = AutoTokenizer.from_pretrained(model_name)
+            return self._tokenizers[model_name]
+
+    def get_qdrant_client(self, host="localhost", port=6333, grpc_port=6334, prefer_grpc=False, path=None):
+        """
+        Get a Qdrant client for a server, or for a local Qdrant stored in a folder, creating it on first use.
+        Args:
+            host (str): Hostname of the Qdrant server.
+            port (int): HTTP port of the Qdrant server.
+            grpc_port (int): gRPC port of the Qdrant server.
+            prefer_grpc (bool): Whether the client talks to Qdrant over gRPC instead of HTTP.
+            path (str): If given, Qdrant runs inside this process and stores its data in this folder.
+                The server settings are ignored.
+
+        Returns:
+            QdrantClient: The shared client.
+        """
+        key = (str(path),) if path is not None else (host, port, grpc_port, prefer_grpc)
+        with self._lock:
+            if key not in self._qdrant_clients:
+                from qdrant_client import QdrantClient
+
+                if path is not None:
+                    # Local mode locks the folder, so only one client per process may open it
+                    self._qdrant_clients[key] = QdrantClient(path=str(path))
+                else:
+                    self._qdrant_clients[key] = QdrantClient(
+                        host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc
+                    )
+            return self._qdrant_clients[key]
+
+    def get_vector_store(self, vector_store=None, host="localhost", port=6333, grpc_port=6334, prefer_grpc=False):
+        """
+        Get a vector store, creating it on first use.
+        Args:
+            vector_store (str): 'qdrant' (Qdrant server), 'qdrant_local' (Qdrant stored in .cache/qdrant, no server)
+                or 'mmap' (memory-mapped NumPy matrix in .cache/vectors, no server). Defaults to VECTOR_STORE.
+            host (str): Hostname of the Qdrant server.
+            port (int): HTTP port of the Qdrant server.
+            grpc_port (int): gRPC port of the Qdrant server.
+            prefer_grpc (bool): Whether the client talks to Qdrant over gRPC instead of HTTP.
+
+        Returns:
+            VectorStore: The shared store.
+        """
+        vector_store = resolve_vector_store(vector_store)
+        if vector_store == "qdrant":
+            key = (vector_store, host, port, grpc_port, prefer_grpc)
+        else:
+            key = (vector_store, str(DEFAULT_CACHE_DIR / ("qdrant" if vector_store == "qdrant_local" else "vectors")))
+        with self._lock:
+            store = self._vector_stores.get(key)
+        if store is not None:
+            return store
+
+        # Clients are created outside the lock, since get_qdrant_client takes it as well
+        if vector_store == "qdrant":
+            store = QdrantVectorStore(self.get_qdrant_client(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc))
+        elif vector_store == "qdrant_local":
+            store = QdrantVectorStore(self.get_qdrant_client(path=key[1]), payload_index=False)
+        else:
+            store = MmapVectorStore(key[1])
+        with self._lock:
+            return self._vector_stores.setdefault(key, store)
+
+    def loaded_models(self):
+        """
+        List the models currently held by the registry.
+        Returns:
+            list: Name and backend of each loaded model.
+        """
+        with self._lock:
+            return list(self._models)
+
+
+if __name__ == "__main__":
+    # Example standalone usage
+    print("Testing ModelRegistry functionality...")
+
+    registry = ModelRegistry.shared()
+    tokenizer, model = registry.get_model("BAAI/bge-small-en")
+    same_tokenizer, same_model = ModelRegistry.shared().get_model("BAAI/bge-small-en")
+    print(f"Model loaded once and shared: {model is same_model}")
+    print(f"Loaded models: {registry.loaded_models()}")
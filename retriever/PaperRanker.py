@@ -0,0 +1,120 @@
+import json
+from retriever.PipelineResults import PaperScore, RetrievalResult
+
+
+class PaperRanker:
+    AGGREGATIONS = ("max", "mean_top_m", "sum")
+
+    def __init__(self, top_k_chunks=None, top_n_papers=None, aggregation="max", top_m=3):
+        """
+        Initialize the PaperRanker that turns scored chunks into a ranked selection of papers.
+        Args:
+            top_k_chunks (int): Number of best chunks kept for the report. None keeps every chunk.
+            top_n_papers (int): Number of best papers passed on to later stages. None keeps every paper.
+            aggregation (str): How chunk scores are combined into a paper score:
+                'max' (best chunk), 'mean_top_m' (mean of the top_m best chunks) or 'sum' (all chunks).
+            top_m (int): Number of chunks averaged by the 'mean_top_m' aggregation.
+        """
+        if aggregation not in self.AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation '{aggregation}'. Choose one of {self.AGGREGATIONS}.")
+        self.top_k_chunks = top_k_chunks
+        self.top_n_papers = top_n_papers
+        self.aggregation = aggregation
+        self.top_m = top_m
+
+    def _aggregate(self, scores):
+        """
+        Combine the chunk scores of one paper.
+        Args:
+            scores (list): Chunk scores, best first.
+
+        Returns:
+            float: The paper score.
+        """
+        if self.aggregation == "max":
+            return scores[0]
+        if self.aggregation == "mean_top_m":
+            top_scores = scores[:self.top_m]
+            return sum(top_scores) / len(top_scores)
+        return sum(scores)
+
+    def score_papers(self, results):
+        """
+        Compute a score for every paper from the scores of its chunks.
+        Args:
+            results (list): ScoredChunk objects.
+
+        Returns:
+            list: One PaperScore per paper, best first.
+        """
+        scores_by_source = {}
+        url_by_source = {}
+        for result in results:
+            scores_by_source.setdefault(result.source, []).append(result.score)
+            if result.url and result.source not in url_by_source:
+                url_by_source[result.source] = result.url
+
+        papers = []
+        for source, scores in scores_by_source.items():
+            scores.sort(reverse=True)
+            papers.append(PaperScore(
+                source=source,
+                score=float(self._aggregate(scores)),
+                num_chunks=len(scores),
+                url=url_by_source.get(source)
+            ))
+        papers.sort(key=lambda x: x.score, reverse=True)
+        for rank, paper in enumerate(papers, start=1):
+            paper.rank = rank
+        return papers
+
+    def select(self, results):
+        """
+        Select the top-n papers and the top-k chunks belonging to them.
+        Papers are ranked on all of their chunks before any chunk is dropped.
+        Args:
+            results (list): ScoredChunk objects.
+
+        Returns:
+            RetrievalResult: The selected papers and their best chunks, best first.
+        """
+        papers = self.score_papers(results)
+        if self.top_n_papers is not None:
+            papers = papers[:self.top_n_papers]
+
+        selected_sources = {paper.source for paper in papers}
+        chunks = sorted(
+            (result for result in results if result.source in selected_sources),
+            key=lambda x: x.score,
+            reverse=True
+        )
+        if self.top_k_chunks is not None:
+            chunks = chunks[:self.top_k_chunks]
+        return RetrievalResult(papers=papers, chunks=chunks)
+
+    @staticmethod
+    def read_relevant_papers(filename):
+        """
+        Read the set of relevant papers from a JSONL report.
+        Reports written with paper scores start with one line per selected paper, so only those lines are read.
+        Older reports without paper lines fall back to every distinct Source.
+        Args:
+            filename (str): Path to the JSONL report.
+
+        Returns:
+            set: Sources of the relevant papers.
+        """
+        sources = set()
+        has_paper_lines = False
+        with open(filename, 'r', encoding='utf-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                if "Paper Rank" in entry:
+                    has_paper_lines = True
+                    sources.add(entry["Source"])
+                elif has_paper_lines:
+                    # The paper lines are over; the remaining lines are chunks of the same papers
+                    break
+                else:
+                    sources.add(entry["Source"])
+        return sources
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+import PyPDF2
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+
+
+class PdfTextStore:
+    def __init__(self, cache_dir=None):
+        """
+        Initialize a store of extracted PDF text shared by every pipeline stage.
+        Each PDF is parsed at most once per version: its per-page text is persisted on disk,
+        keyed by the absolute file path, size and modification time, and kept in memory after first use.
+        Args:
+            cache_dir (str): Folder holding the extracted text. Defaults to .cache/pdf_text in the repository.
+        """
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR / "pdf_text")
+        self._pages_by_fingerprint = {}
+
+    def fingerprint(self, pdf_path):
+        """
+        Identify the current version of a PDF file.
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            tuple: Absolute path, size in bytes and modification time in nanoseconds.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        stat = os.stat(pdf_path)
+        return os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns
+
+    def _cache_file(self, fingerprint):
+        """
+        Get the on-disk location of the extracted text for a PDF version.
+        Args:
+            fingerprint (tuple): Fingerprint returned by fingerprint().
+
+        Returns:
+            Path: Path to the JSON file holding the per-page text.
+        """
+        digest = hashlib.sha1(json.dumps(fingerprint).encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def get_pages(self, pdf_path):
+        """
+        Get the text of every page of a PDF, parsing the file only if it has not been seen before.
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            list: Text of each page, in page order.
+        """
+        fingerprint = self.fingerprint(pdf_path)
+        if fingerprint in self._pages_by_fingerprint:
+            return self._pages_by_fingerprint[fingerprint]
+
+        cache_file = self._cache_file(fingerprint)
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pages = self._extract_pages(pdf_path)
+            self._write_cache_file(cache_file, fingerprint, pages)
+
+        self._pages_by_fingerprint[fingerprint] = pages
+        return pages
+
+    def get_text(self, pdf_path):
+        """
+        Get the full text of a PDF.
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            str: The text of all pages joined together.
+        """
+        return "".join(self.get_pages(pdf_path))
+
+    def _extract_pages(self, pdf_path):
+        """
+        Parse a PDF with PyPDF2.
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            list: Text of each page, in page order.
+        """
+        with open(pdf_path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            return [page.extract_text() or "" for page in reader.pages]
+
+    def _write_cache_file(self, cache_file, fingerprint, pages):
+        """
+        Persist extracted pages. The file is written under a temporary name and then renamed,
+        so concurrent readers never see a partial file.
+        Args:
+            cache_file (Path): Destination returned by _cache_file().
+            fingerprint (tuple): Fingerprint of the PDF version.
+            pages (list): Text of each page.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"path": fingerprint[0], "size": fingerprint[1], "mtime_ns": fingerprint[2], "pages": pages}, f)
+        os.replace(temp_file, cache_file)
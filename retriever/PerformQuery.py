@@ -1,44 +1,49 @@
-import torch
 import json
-from qdrant_client import QdrantClient
-from qdrant_client.http.exceptions import ResponseHandlingException
-from transformers import AutoTokenizer, AutoModel
 import re
 import datetime
 import numpy as np
+from retriever.EmbeddingBackend import cache_model_key, resolve_backend
+from retriever.EmbeddingCache import EmbeddingCache
+from retriever.ModelRegistry import ModelRegistry
 
 
 class PerformQuery:
-    def __init__(self, model_name="BAAI/bge-small-en", qdrant_host="localhost", qdrant_port=6333, collection_name="paper_chunks"):
+    def __init__(self, model_name="BAAI/bge-small-en", qdrant_host="localhost", qdrant_port=6333, collection_name="paper_chunks", use_cache=True, registry=None, backend=None, max_length=512, vector_store=None):
         """
-        Initialize PerformQuery with a Qdrant client and embedding model.
+        Initialize PerformQuery with a vector store and embedding model.
         Args:
             model_name (str): Hugging Face model name for embedding generation.
             qdrant_host (str): Hostname for Qdrant.
             qdrant_port (int): Port for Qdrant.
-            collection_name (str): Name of the Qdrant collection.
+            collection_name (str): Name of the collection.
+            use_cache (bool): Whether to reuse embeddings from the on-disk embedding cache.
+            registry (ModelRegistry): Registry providing the shared model and store. Defaults to the process-wide one.
+            backend (str): Embedding backend ('transformers', 'int8' or 'onnx'). Defaults to EMBEDDING_BACKEND.
+            max_length (int): Embedding window in tokens. Must match the window used to embed the chunks.
+            vector_store (str): Vector store holding the chunks: 'qdrant', 'qdrant_local' or 'mmap'.
+                Defaults to VECTOR_STORE. The Qdrant settings only apply to 'qdrant'.
         """
-        self.qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
+        registry = registry or ModelRegistry.shared()
+        self.vector_store = registry.get_vector_store(vector_store, host=qdrant_host, port=qdrant_port)
         self.collection_name = collection_name
+        self.max_length = max_length
 
-        # Initialize tokenizer and model
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+        # Shared tokenizer and model
+        self.backend = resolve_backend(backend)
+        self.tokenizer, self.model = registry.get_model(model_name, self.backend)
+        self.embedding_cache = EmbeddingCache(cache_model_key(model_name, self.backend)) if use_cache else None
+        # The collection is checked before the first search, so similarity calculations work without a store
+        self._collection_checked = False
 
-        # Ensure the Qdrant collection exists
-        self._initialize_qdrant_collection()
-
-    def _initialize_qdrant_collection(self):
+    def _initialize_collection(self):
         """
-        Ensure the Qdrant collection exists. Raise an error if it doesn't exist.
+        Ensure the collection exists. Raise an error if it doesn't exist.
         """
-        try:
-            collections = self.qdrant_client.get_collections()
-            if self.collection_name not in [col.name for col in collections.collections]:
-                raise Exception(f"Collection '{self.collection_name}' does not exist in Qdrant. Ensure it is created and populated before querying.")
-        except ResponseHandlingException as e:
-            print(f"Error while checking Qdrant collections: {e}")
-            raise e
+        if self._collection_checked:
+            return
+        if not self.vector_store.collection_exists(self.collection_name):
+            raise Exception(f"Collection '{self.collection_name}' does not exist. Ensure it is created and populated before querying.")
+        self._collection_checked = True
 
     def get_embedding(self, text):
         """
@@ -49,10 +54,21 @@ class PerformQuery:
         Returns:
             numpy.ndarray: The embedding vector.
         """
-        inputs = self.tokenizer(text, return_tensors="pt", max_length=384, truncation=True)
+        if self.embedding_cache:
+            cached = self.embedding_cache.get(text, max_length=self.max_length)
+            if cached is not None:
+                return cached
+
+        import torch
+
+        inputs = self.tokenizer(text, return_tensors="pt", max_length=self.max_length, truncation=True)
         with torch.no_grad():
             outputs = self.model(**inputs)
-        return torch.mean(outputs.last_hidden_state, dim=1).squeeze().numpy()
+        embedding = torch.mean(outputs.last_hidden_state, dim=1).squeeze().numpy()
+
+        if self.embedding_cache:
+            self.embedding_cache.set(text, embedding, max_length=self.max_length)
+        return embedding
 
     def calculate_similarity(self, query_vector, chunk_vector):
         """
@@ -69,31 +85,49 @@ class PerformQuery:
         norm_chunk = np.linalg.norm(chunk_vector)
         return dot_product / (norm_query * norm_chunk)
 
-    def query_qdrant(self, query_text, top_k=5):
+    def calculate_similarities(self, query_vector, chunk_matrix):
+        """
+        Calculate the cosine similarity between the query vector and every row of a chunk matrix
+        with a single matrix-vector product.
+        Args:
+            query_vector (numpy.ndarray): Query embedding.
+            chunk_matrix (numpy.ndarray): Chunk embeddings, one per row.
+
+        Returns:
+            numpy.ndarray: Cosine similarity score for each chunk.
         """
-        Perform a similarity search in Qdrant for the given query text.
+        chunk_matrix = np.asarray(chunk_matrix)
+        if len(chunk_matrix) == 0:
+            return np.zeros(0, dtype=np.float32)
+        dot_products = chunk_matrix @ query_vector
+        norms = np.linalg.norm(chunk_matrix, axis=1) * np.linalg.norm(query_vector)
+        return dot_products / norms
+
+    def query_index(self, query_text, top_k=5, paper_ids=None):
+        """
+        Perform a similarity search in the vector store for the given query text.
         Args:
             query_text (str): Text query for similarity search.
             top_k (int): Number of top results to retrieve.
+            paper_ids (list): If given, only chunks whose paper_id payload is in this list are searched.
 
         Returns:
-            list: Search results from Qdrant.
+            list: Search results with id, score and payload attributes, best first.
         """
+        self._initialize_collection()
+
         # Get embedding for the query text
         query_embedding = self.get_embedding(query_text)
 
         try:
-            # Perform search in Qdrant
-            search_results = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding.tolist(),
-                limit=top_k
-            )
-            return search_results
-        except ResponseHandlingException as e:
-            print(f"Error during Qdrant search: {e}")
+            return self.vector_store.search(self.collection_name, query_embedding, top_k=top_k, paper_ids=paper_ids)
+        except Exception as e:
+            print(f"Error during vector search: {e}")
             raise e
 
+    # Name from before the vector store interface, kept for existing callers
+    query_qdrant = query_index
+
     def save_query_results(self, query_text, results):
         """
         Save query results to a JSON file.
@@ -140,7 +174,7 @@ if __name__ == "__main__":
     print("I'm using the wrong query")
     try:
         # Perform the query
-        results = perform_query.query_qdrant(query_text, top_k=20)
+        results = perform_query.query_index(query_text, top_k=20)
 
         # Display results
         for i, result in enumerate(results):
@@ -0,0 +1,62 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StageMessage:
+    """A progress message for the user, as sent to message_output."""
+    text: str
+
+
+@dataclass
+class ChunksScored:
+    """Chunks of one group of papers ('local' or 'external') were scored against the query."""
+    scope: str
+    num_chunks: int
+    best_similarity: float = None
+
+
+@dataclass
+class PapersSelected:
+    """The papers selected for the analysis, as PaperScore objects in rank order."""
+    papers: list = field(default_factory=list)
+
+
+@dataclass
+class QuestionsReady:
+    """Questions are ready: the naive questions shared by all papers (paper_id None) or the nuanced questions of one paper."""
+    questions: list
+    paper_id: str = None
+
+
+@dataclass
+class PaperAnswered:
+    """The answers of one paper, keyed by question."""
+    paper_id: str
+    answers: dict
+
+
+@dataclass
+class MemoToken:
+    """A piece of the memo text, in the order it is generated."""
+    text: str
+
+
+@dataclass
+class PipelineFinished:
+    """The run is complete."""
+    run_id: str
+    memo_path: str = None
+
+
+if __name__ == "__main__":
+    print("Testing PipelineEvents functionality...")
+
+    events = [
+        StageMessage("Starting research pipeline ..."),
+        ChunksScored(scope="local", num_chunks=120, best_similarity=0.83),
+        QuestionsReady(questions=["What is the title of the paper?"]),
+        MemoToken("# Policy memo"),
+        PipelineFinished(run_id="example")
+    ]
+    for event in events:
+        print(event)
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ScoredChunk:
+    """A chunk of a paper with its cosine similarity to the query and, in hybrid mode, its fused rank score."""
+    source: str
+    content: str
+    similarity: float
+    url: str = None
+    fused_score: float = None
+
+    @property
+    def score(self):
+        """
+        Get the score the chunk is ranked by.
+        Returns:
+            float: The fused score in hybrid mode, otherwise the cosine similarity.
+        """
+        return self.fused_score if self.fused_score is not None else self.similarity
+
+    def to_report_line(self, include_url=False):
+        """
+        Convert the chunk to a line of a JSONL report.
+        Args:
+            include_url (bool): Whether to include the URL (for external papers).
+
+        Returns:
+            dict: The report line.
+        """
+        line = {"Source": self.source, "Content": self.content, "Similarity Score": self.similarity}
+        if self.fused_score is not None:
+            line["Fused Score"] = self.fused_score
+        if include_url and self.url:
+            line["URL"] = self.url
+        return line
+
+
+@dataclass
+class PaperScore:
+    """A paper with the aggregate score of its chunks and its rank among the scored papers."""
+    source: str
+    score: float
+    num_chunks: int
+    rank: int = 0
+    url: str = None
+
+    def to_report_line(self, include_url=False):
+        """
+        Convert the paper to a line of a JSONL report.
+        Args:
+            include_url (bool): Whether to include the URL (for external papers).
+
+        Returns:
+            dict: The report line.
+        """
+        line = {"Source": self.source, "Paper Score": self.score, "Paper Rank": self.rank, "Chunk Count": self.num_chunks}
+        if include_url and self.url:
+            line["URL"] = self.url
+        return line
+
+
+@dataclass
+class RetrievalResult:
+    """The papers selected for the analysis and their best chunks, both best first."""
+    papers: list = field(default_factory=list)
+    chunks: list = field(default_factory=list)
+
+    @property
+    def sources(self):
+        """
+        Get the sources of the selected papers.
+        Returns:
+            list: Paper sources in rank order.
+        """
+        return [paper.source for paper in self.papers]
+
+
+if __name__ == "__main__":
+    print("Testing PipelineResults functionality...")
+
+    chunk = ScoredChunk(source="paper.pdf", content="Example chunk.", similarity=0.82)
+    result = RetrievalResult(papers=[PaperScore(source="paper.pdf", score=0.82, num_chunks=1, rank=1)], chunks=[chunk])
+    print(f"Sources: {result.sources}")
+    print(f"Report lines: {[paper.to_report_line() for paper in result.papers] + [chunk.to_report_line()]}")
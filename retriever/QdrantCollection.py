@@ -1,46 +1,64 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams
+from retriever.ModelRegistry import ModelRegistry
 
 
 class QdrantCollection:
-    def __init__(self, host="localhost", port=6333, collection_name="paper_chunks", vector_size=384, distance="Cosine"):
+    def __init__(self, host="localhost", port=6333, collection_name="paper_chunks", vector_size=384, distance="Cosine", recreate=False,
+                 vector_store=None, registry=None):
         """
-        Initialize the QdrantCollection with connection parameters and recreate the collection.
+        Initialize the QdrantCollection with connection parameters and make sure the collection exists.
         Args:
             host (str): Hostname for Qdrant.
             port (int): Port for Qdrant.
-            collection_name (str): Name of the Qdrant collection.
+            collection_name (str): Name of the collection.
             vector_size (int): Dimension of the vector embeddings.
-            distance (str): Distance metric for similarity search ('Cosine', 'Euclid', etc.).
+            distance (str): Distance metric for similarity search. Only 'Cosine' is supported by every vector store.
+            recreate (bool): Whether to wipe and recreate the collection instead of keeping an existing index.
+            vector_store (str): 'qdrant', 'qdrant_local' or 'mmap'. Defaults to the VECTOR_STORE environment variable.
+            registry (ModelRegistry): Registry providing the shared vector store. Defaults to the process-wide one.
         """
-        self.client = QdrantClient(host=host, port=port)
+        if distance != "Cosine":
+            raise ValueError(f"Unsupported distance '{distance}'. Vector stores compare vectors by cosine similarity.")
+        self.vector_store = (registry or ModelRegistry.shared()).get_vector_store(vector_store, host=host, port=port)
         self.collection_name = collection_name
         self.vector_size = vector_size
         self.distance = distance
 
-        self._initialize_collection()
+        self._initialize_collection(recreate)
 
-    def _initialize_collection(self):
+    def _initialize_collection(self, recreate=False):
         """
-        Recreate the Qdrant collection if it doesn't already exist.
+        Create the collection if it doesn't already exist, or recreate it when asked to.
+        Args:
+            recreate (bool): Whether to delete an existing collection first.
         """
         try:
-            self.client.recreate_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=self.vector_size, distance=self.distance)
-            )
-            print(f"Connected to Qdrant and collection '{self.collection_name}' created.")
+            exists = self.vector_store.collection_exists(self.collection_name)
+            if exists and not recreate:
+                print(f"Connected to the vector store and collection '{self.collection_name}' already exists.")
+                return
+            if exists:
+                self.vector_store.drop_collection(self.collection_name)
+            self.vector_store.create_collection(self.collection_name, self.vector_size)
+            print(f"Connected to the vector store and collection '{self.collection_name}' created.")
         except Exception as e:
-            print(f"Failed to connect to Qdrant or initialize collection: {e}")
+            print(f"Failed to connect to the vector store or initialize collection: {e}")
             raise
 
+    def get_vector_store(self):
+        """
+        Get the vector store holding the collection.
+        Returns:
+            VectorStore: The vector store.
+        """
+        return self.vector_store
+
     def get_client(self):
         """
         Get the Qdrant client instance.
         Returns:
-            QdrantClient: The Qdrant client.
+            QdrantClient: The Qdrant client, or None if the collection is not in a Qdrant store.
         """
-        return self.client
+        return getattr(self.vector_store, "client", None)
 
     def get_collection_name(self):
         """
@@ -1,24 +1,46 @@
 import os
 import json
-import PyPDF2
-import google.generativeai as genai
 from dotenv import load_dotenv
 import ast
-import glob
-from pathlib import Path  # Make sure Path is imported
-from retriever.QuestionsAndAnswers.naiveQuestions import NaiveQuestions
-from retriever.QuestionsAndAnswers.nuancedQuestions import PaperEmbeddingAnalyzer, NuancedQuestions
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from retriever.QuestionsAndAnswers.geminiClient import GeminiClient
+from retriever.PdfTextStore import PdfTextStore
+from retriever.PipelineEvents import PaperAnswered, QuestionsReady
+from retriever.RunManifest import RunManifest
+from retriever.StageTracer import StageTracer
+from retriever.QuestionsAndAnswers.llmCache import llm_counters
 import re
 
 load_dotenv()
 
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
 class QuestionAnswerer:
-    def __init__(self,  message_output=None):
+    def __init__(self,  message_output=None, pdf_text_store=None, gemini_client=None, max_concurrency=4, request_timeout=120, registry=None, embedding_backend=None, manifest=None, event_output=None, tracer=None, embedder=None, chunker=None, keyword_index=None):
         self.questions_list = []   
         self.relevant_papers_ids = [] 
+        # Nuanced questions of each paper, kept in memory for the answering stage
+        self.nuanced_questions = {}
+        # Run whose directory receives the generated questions and answers
+        # Required, so a stage never creates a run directory of its own
+        if manifest is None:
+            raise ValueError("QuestionAnswerer needs the RunManifest of the run it belongs to")
+        self.manifest = manifest
+        # Receives typed pipeline events as questions and answers become available
+        self.event_output = event_output
+        # Records the cost of question generation and answering
+        self.tracer = tracer or StageTracer(run_id=self.manifest.run_id)
         self.message_output = message_output or print
+        self.pdf_text_store = pdf_text_store or PdfTextStore()
+        # Shared Gemini client; any object with a compatible generate() method can be injected
+        self.gemini_client = gemini_client or GeminiClient()
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.registry = registry
+        self.embedding_backend = embedding_backend
+        # The pipeline's embedding layer and chunker, so the topic model reuses the chunk embeddings already computed
+        self.embedder = embedder
+        self.chunker = chunker
+        # Keywords extracted when the papers were ingested, looked up by nuanced question generation
+        self.keyword_index = keyword_index
 
     def message(self, text):
         """
@@ -27,17 +49,18 @@ class QuestionAnswerer:
         if self.message_output:
             self.message_output(text)
 
+    def emit(self, event):
+        """
+        Utility method to output pipeline events
+        """
+        if self.event_output:
+            self.event_output(event)
+
     def extract_text_from_pdf(self, paper_id):
         pdf_path = f"./{paper_id}"
         
         try:
-            with open(pdf_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text += page.extract_text()
-            return text
+            return self.pdf_text_store.get_text(pdf_path)
         except FileNotFoundError:
             print(f"File {pdf_path} not found.")
             return ""
@@ -50,7 +73,6 @@ class QuestionAnswerer:
         
     def answer_question_gemini(self, questions, paper_text):
         
-        genai.configure(api_key=gemini_api_key)
         # GEMINI SET UP
         generation_config = {
             "temperature": 0.1,
@@ -82,14 +104,14 @@ class QuestionAnswerer:
         If the provided paper contains no data to respond to a question, leave the field as an empty string and don't make up any data.
         """
 
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
+        response_text = self.gemini_client.generate(
+            paper_text,
             system_instruction=prompt,
+            generation_config=generation_config,
+            timeout=self.request_timeout
         )
-        response = model.generate_content(paper_text)
 
-        response_cleaned = self.clean_json_string(response.text)
+        response_cleaned = self.clean_json_string(response_text)
 
         # Use json.loads to convert the cleaned string into a dictionary
         try:
@@ -100,125 +122,129 @@ class QuestionAnswerer:
 
         return response_json
     
-    def retrieve_naive(self, user_query): 
+    def retrieve_naive(self, user_query, relevant_papers=None): 
         print("Calling retrieve naive function")
         self.message("❓ Generating questions based on multiple perspectives on the topic provided to compare the papers retrieved ... ")
         # Run Naive Question class which identifies relevant papers and creates naive questions
-        naive_questions = NaiveQuestions()
-        self.relevant_papers_ids = naive_questions.run(user_query=user_query)
-
-        # Find latest comparison question file and import it
-        try:
-            files = list(Path(".").glob("comparison_questions_*.txt"))
-            
-            if not files:
-                print("No comparison questions files found.")
-                return None
-            
-            # Sort files by modification time in descending order
-            latest_questions_file = max(files, key=lambda f: f.stat().st_mtime)
-            print(f"Found latest file: {latest_questions_file}")
-        
-        except Exception as e:
-            print(f"Error accessing directory: {e}")
-            return None
-        
-        # Transform txt into python list of questions
-        try:
-            with open(latest_questions_file, 'r', encoding='utf-8') as f:
-                return  ast.literal_eval(f.read())
-        except Exception as e:
-            print(f"\nError reading questions file: {e}")
-            return
+        from retriever.QuestionsAndAnswers.naiveQuestions import NaiveQuestions
+
+        naive_questions = NaiveQuestions(manifest=self.manifest)
+        with self.tracer.stage("naive_questions", counters=llm_counters(naive_questions)) as counts:
+            self.relevant_papers_ids, questions = naive_questions.run(user_query=user_query, relevant_papers=relevant_papers)
+            counts["questions"] = len(questions or [])
+        if questions is not None:
+            self.emit(QuestionsReady(questions=questions))
+        return questions
         
     
     def generate_nuanced(self, external_contents, external_content_by_title):
-        # This creates a file with nuanced for all relevant pappers 
+        # Generates the nuanced questions of every relevant paper and keeps them in memory
         print("Generating nuanced questions.... ")
         self.message("🧐 Generating questions to capture the nuances of the retrieved papers ... ")
-        embedding_analyzer = PaperEmbeddingAnalyzer()
-        analyzer = NuancedQuestions(embedding_analyzer)
-        analyzer.run(external_contents, external_content_by_title)
+        # Loads torch and the topic modeling stack, so it is only imported when this stage runs
+        from retriever.QuestionsAndAnswers.nuancedQuestions import PaperEmbeddingAnalyzer, NuancedQuestions
+
+        embedding_analyzer = PaperEmbeddingAnalyzer(
+            registry=self.registry, backend=self.embedding_backend, embedder=self.embedder, chunker=self.chunker
+        )
+        analyzer = NuancedQuestions(
+            embedding_analyzer,
+            pdf_text_store=self.pdf_text_store,
+            gemini_client=self.gemini_client,
+            llm_concurrency=self.max_concurrency,
+            manifest=self.manifest,
+            tracer=self.tracer,
+            keyword_index=self.keyword_index
+        )
+        counters = {**llm_counters(self.gemini_client), "keyword_index": analyzer.keyword_index.stats}
+        with self.tracer.stage("nuanced_questions", counters=counters) as counts:
+            self.nuanced_questions = analyzer.run(external_contents, external_content_by_title, self.relevant_papers_ids)
+            counts["papers"] = len(self.nuanced_questions)
+            for name, num_papers in analyzer.feature_counts.items():
+                counts[f"{name}_features"] = num_papers
+        for paper_id, questions in self.nuanced_questions.items():
+            self.emit(QuestionsReady(questions=questions, paper_id=paper_id))
         return
 
 
 
     def retrieve_nuanced(self, paper_id):
         """
-        Retrieves and parses questions for a given paper_id from the most recent question results file.
+        Retrieves the nuanced questions generated for a given paper_id in this run.
         """
-        pattern = "question_results_*.jsonl"
-        files = glob.glob(pattern)
-        
-        if not files:
-            raise FileNotFoundError("No question results files found.")
-        
-        latest_file = max(files, key=lambda x: x)
-        
-        try:
-            with open(latest_file, 'r') as file:
-                for line in file:
-                    entry = json.loads(line.strip())
-                    if entry.get('paper_id') == paper_id:
-                        return entry['questions']
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse JSON in file '{latest_file}': {str(e)}")
-        
-        # If no matching paper_id is found
-        raise ValueError(f"Paper ID '{paper_id}' not found in {latest_file}")
+        if paper_id not in self.nuanced_questions:
+            raise ValueError(f"Paper ID '{paper_id}' has no nuanced questions in run '{self.manifest.run_id}'")
+        return self.nuanced_questions[paper_id]
+
+    def answer_paper(self, paper_id, external_content_by_title):
+        """
+        Answer the naive and nuanced questions for one paper.
+        Args:
+            paper_id (str): Path of a local paper, or title of a paper retrieved from Semantic Scholar.
+            external_content_by_title (dict): Content of the external papers, keyed by title.
 
-    def run(self, user_query, all_external_content, external_content_by_title):
+        Returns:
+            dict: Answers keyed by question.
+        """
+        # If local paper
+        if paper_id not in external_content_by_title.keys():
+            paper_text = self.extract_text_from_pdf(paper_id)
+        # Else, paper from semantic scholar
+        else:
+            print("\nReading extract from paper {} ...".format(paper_id))
+            paper_text = external_content_by_title[paper_id]
+
+        # Retrieve nuanced questions
+        nuanced = self.retrieve_nuanced(paper_id)
+
+        all_questions = self.questions_list + nuanced
+
+        # Call the function to get the answers for the questions
+        answers = self.answer_question_gemini(all_questions, paper_text)
+
+        if paper_id in external_content_by_title.keys():
+            if 'what_is_the_title_of_the_paper' not in answers or not answers['what_is_the_title_of_the_paper']:
+                answers['what_is_the_title_of_the_paper'] = paper_id
+        return answers
+
+    def run(self, user_query, all_external_content, external_content_by_title, relevant_papers=None):
         print(f"\nStarting question answering script with naive and nuanced questions...")
         final_json = {}
 
         # Update questions list
-        self.questions_list = self.retrieve_naive(user_query=user_query)
+        self.questions_list = self.retrieve_naive(user_query=user_query, relevant_papers=relevant_papers)
+        if not self.relevant_papers_ids:
+            print("No relevant papers to answer questions for.")
+            return {}
 
         # Modify hereee
         self.generate_nuanced(all_external_content, external_content_by_title)
 
         self.message("📝 Starting to answer the questions generated for each relevant paper ...")
-        # Answer questions for each paper
-        for paper_id in self.relevant_papers_ids: 
-            # If local paper
-            if paper_id not in external_content_by_title.keys():
-                paper_text = self.extract_text_from_pdf(paper_id)
-                self.message("... ⏩️ Answering question for {} ...".format(paper_id))  
-
-                # Retrieve nuanced questions
-                nuanced = self.retrieve_nuanced(paper_id)
-
-                all_questions = self.questions_list + nuanced
-
-                # Call the function to get the answers for the questions
-                answers = self.answer_question_gemini(all_questions, paper_text)
-                
-                # Add the answers to the final JSON dictionary under the paper_id
-                final_json[paper_id] = answers
-
-            # Else, paper from semantic scholar
-            else: 
-                print("\nReading extract from paper {} ...".format(paper_id))
-                paper_text = external_content_by_title[paper_id]
-                self.message("... ⏩️ Answering question for {} ...".format(paper_id))  
-                print("Answering questions for {}".format(paper_id))
-            
-                # Retrieve nuanced questions
-                nuanced = self.retrieve_nuanced(paper_id)
-
-                all_questions = self.questions_list + nuanced
-
-                # Call the function to get the answers for the questions
-                answers = self.answer_question_gemini(all_questions, paper_text)
-                
-                # Add the answers to the final JSON dictionary under the paper_id
-                final_json[paper_id] = answers
-
-                if 'what_is_the_title_of_the_paper' not in final_json[paper_id] or not final_json[paper_id]['what_is_the_title_of_the_paper']:
-                    final_json[paper_id]['what_is_the_title_of_the_paper'] = paper_id
-
-        # Specify the filename and path to save the JSON
-        output_path = os.path.join(os.getcwd(), "paper_answers.json")
+        # Answer questions for all papers concurrently; messages are only sent from this thread
+        with self.tracer.stage("answering", counters=llm_counters(self.gemini_client)) as counts:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = {}
+                for paper_id in self.relevant_papers_ids:
+                    self.message("... ⏩️ Answering question for {} ...".format(paper_id))
+                    future = executor.submit(self.answer_paper, paper_id, external_content_by_title)
+                    futures[future] = paper_id
+
+                answers_by_paper = {}
+                for future in as_completed(futures):
+                    paper_id = futures[future]
+                    try:
+                        answers_by_paper[paper_id] = future.result()
+                        self.emit(PaperAnswered(paper_id=paper_id, answers=answers_by_paper[paper_id]))
+                        print("Answered questions for {}".format(paper_id))
+                    except Exception as e:
+                        print(f"Error answering questions for {paper_id}: {e}")
+            counts["papers"] = len(answers_by_paper)
+
+        # Keep the papers in their original order
+        for paper_id in self.relevant_papers_ids:
+            if paper_id in answers_by_paper:
+                final_json[paper_id] = answers_by_paper[paper_id]
 
         filtered_json = {}
         filtered_out = 0
@@ -232,13 +258,15 @@ class QuestionAnswerer:
         self.message(f"🔻 Filtered out {filtered_out} papers because they could not answer the generated comparison questions. ")
         print("Filtered out ", filtered_out, "papers because of empty repsonses")
 
-        # Save the filtered JSON
-        output_path = os.path.join(os.getcwd(), "paper_answers.json")
+        # Save the filtered JSON in the run directory; the answers are also returned to the memo stage
+        output_path = self.manifest.path_for("paper_answers.json")
 
         with open(output_path, "w") as json_file:
             json.dump(filtered_json, json_file, indent=4)
+        self.manifest.add_artifact("paper_answers", output_path)
 
         print(f"Output JSON saved at {output_path}")
+        return filtered_json
 
 
 if __name__ == "__main__":
@@ -258,5 +286,6 @@ if __name__ == "__main__":
             }
     user_query = "I am the mayor of SF and I want to create a policy that fosters financial inclusion on the mission district. I want to implement this from a gender perspective focused on women that are substance users"
     
-    answer = QuestionAnswerer()
-    answer.run(user_query=user_query, all_external_content= all_external_content, external_content_by_title =  content_by_title)
+    answer = QuestionAnswerer(manifest=RunManifest())
+    answer.run(user_query=user_query, all_external_content= all_external_content, external_content_by_title =  content_by_title,
+               relevant_papers=list(content_by_title))
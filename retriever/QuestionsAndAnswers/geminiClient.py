@@ -0,0 +1,160 @@
+import os
+import threading
+from dotenv import load_dotenv
+import google.generativeai as genai
+from retriever.QuestionsAndAnswers.llmCache import LLMCache, LLMCacheMiss, LLMUsage
+from retriever.QuestionsAndAnswers.rateLimiter import TokenBucket
+
+load_dotenv()
+
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+
+
+class GeminiClient:
+    def __init__(self, model_name="gemini-1.5-flash", api_key=None, requests_per_minute=60, timeout=120, rate_limiter=None,
+                 llm_cache=None, use_cache=True):
+        """
+        Initialize a Gemini client shared by every stage that calls the model.
+        The API is configured once, every request goes through one rate limiter and carries a timeout.
+        Responses are stored in the LLM response cache, and repeated requests are answered from it.
+        Any object with the same generate() method can be used in its place, e.g. a local fake for tests.
+        Args:
+            model_name (str): Name of the Gemini model.
+            api_key (str): Gemini API key. Defaults to the GEMINI_API_KEY environment variable.
+            requests_per_minute (float): Request rate allowed by the default rate limiter.
+            timeout (float): Default per-request timeout in seconds.
+            rate_limiter (TokenBucket): Rate limiter to share with other clients. Created if omitted.
+            llm_cache (LLMCache): Response cache. Defaults to the process-wide cache.
+            use_cache (bool): Whether to read and write the response cache.
+        """
+        genai.configure(api_key=api_key or gemini_api_key)
+        self.model_name = model_name
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or TokenBucket(requests_per_minute)
+        self.llm_cache = (llm_cache or LLMCache.shared()) if use_cache else None
+        # Requests and tokens sent to the API by this client
+        self.usage = LLMUsage()
+        # Model objects reused across requests, keyed by model name and system instruction
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+    def _model(self, system_instruction):
+        """
+        Get the model object for a system instruction, creating it on first use.
+        The generation config is passed with each request, so one object serves every config.
+        Args:
+            system_instruction (str): Optional system instruction for the model.
+
+        Returns:
+            GenerativeModel: The shared model object.
+        """
+        key = (self.model_name, system_instruction)
+        with self._models_lock:
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(
+                    model_name=self.model_name,
+                    system_instruction=system_instruction,
+                )
+            return self._models[key]
+
+    def generate(self, contents, system_instruction=None, generation_config=None, timeout=None):
+        """
+        Generate content with the Gemini model.
+        Args:
+            contents (str): Input passed to generate_content.
+            system_instruction (str): Optional system instruction for the model.
+            generation_config (dict): Optional generation parameters.
+            timeout (float): Timeout in seconds for this request. Defaults to the client timeout.
+
+        Returns:
+            str: The text of the response.
+
+        Raises:
+            LLMCacheMiss: If the cache is in offline mode and the response is not cached.
+        """
+        if self.llm_cache is None:
+            return self._generate(contents, system_instruction, generation_config, timeout)
+        return self.llm_cache.get_or_call(
+            "gemini",
+            self.model_name,
+            generation_config,
+            {"system_instruction": system_instruction, "contents": contents},
+            lambda: self._generate(contents, system_instruction, generation_config, timeout)
+        )
+
+    def generate_stream(self, contents, system_instruction=None, generation_config=None, timeout=None):
+        """
+        Generate content with the Gemini model, yielding the text as it is produced.
+        A cached response is yielded as a single piece; a streamed response is cached once it is complete.
+        Args:
+            contents (str): Input passed to generate_content.
+            system_instruction (str): Optional system instruction for the model.
+            generation_config (dict): Optional generation parameters.
+            timeout (float): Timeout in seconds for this request. Defaults to the client timeout.
+
+        Yields:
+            str: Successive pieces of the response text.
+
+        Raises:
+            LLMCacheMiss: If the cache is in offline mode and the response is not cached.
+        """
+        key = None
+        if self.llm_cache is not None:
+            # Same key as generate(), so streamed and non-streamed calls share cached responses
+            key = self.llm_cache.key(
+                "gemini", self.model_name, generation_config,
+                {"system_instruction": system_instruction, "contents": contents}
+            )
+            cached = self.llm_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+            if self.llm_cache.offline:
+                raise LLMCacheMiss(f"No cached gemini response for model '{self.model_name}' and offline mode is enabled.")
+
+        pieces = []
+        model = self._model(system_instruction)
+        self.rate_limiter.acquire()
+        response = model.generate_content(
+            contents, generation_config=generation_config, stream=True,
+            request_options={"timeout": timeout or self.timeout}
+        )
+        for chunk in response:
+            pieces.append(chunk.text)
+            yield chunk.text
+        self._count_usage(response)
+
+        if key is not None and pieces:
+            self.llm_cache.set(key, "".join(pieces))
+
+    def _generate(self, contents, system_instruction, generation_config, timeout):
+        """
+        Call the Gemini API.
+        Args:
+            contents (str): Input passed to generate_content.
+            system_instruction (str): Optional system instruction for the model.
+            generation_config (dict): Optional generation parameters.
+            timeout (float): Timeout in seconds for this request. Defaults to the client timeout.
+
+        Returns:
+            str: The text of the response.
+        """
+        model = self._model(system_instruction)
+        self.rate_limiter.acquire()
+        response = model.generate_content(
+            contents, generation_config=generation_config, request_options={"timeout": timeout or self.timeout}
+        )
+        self._count_usage(response)
+        return response.text
+
+    def _count_usage(self, response):
+        """
+        Add the token counts reported with a response to the usage counters.
+        Args:
+            response (GenerateContentResponse): A complete Gemini response.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        self.usage.add(
+            getattr(usage, "prompt_token_count", 0),
+            getattr(usage, "candidates_token_count", 0)
+        )
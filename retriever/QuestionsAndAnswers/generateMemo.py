@@ -1,8 +1,12 @@
 from retriever.QuestionsAndAnswers.answer_questions import QuestionAnswerer
+from retriever.QuestionsAndAnswers.geminiClient import GeminiClient
+from retriever.QuestionsAndAnswers.llmCache import llm_counters
+from retriever.PipelineEvents import MemoToken
+from retriever.RunManifest import RunManifest
+from retriever.StageTracer import StageTracer
 import os
 from dotenv import load_dotenv
 from datetime import datetime
-import google.generativeai as genai
 import json
 from pathlib import Path 
 
@@ -11,12 +15,26 @@ from pathlib import Path
 
 load_dotenv()
 
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
 class GenerateMemo:
-    def __init__(self,  message_output=None):
+    def __init__(self,  message_output=None, pdf_text_store=None, registry=None, embedding_backend=None, gemini_client=None, manifest=None, event_output=None, tracer=None, embedder=None, chunker=None, keyword_index=None):
         self.answer_list = []   
         self.message_output = message_output or print
+        self.pdf_text_store = pdf_text_store
+        self.registry = registry
+        self.embedding_backend = embedding_backend
+        # Shared with question answering, so every Gemini call uses the same rate limiter and response cache
+        self.gemini_client = gemini_client or GeminiClient()
+        # Run whose directory receives the questions, answers and memo. A standalone memo run creates one here
+        # and hands it to every sub-stage, so it produces a single run directory
+        self.manifest = manifest or RunManifest()
+        # Receives typed pipeline events, e.g. the memo text as it is generated
+        self.event_output = event_output
+        # Records the cost of the question, answering and memo stages
+        self.tracer = tracer or StageTracer(run_id=self.manifest.run_id)
+        # Handed to question answering, so topic modelling reuses the pipeline's chunk embeddings
+        self.embedder = embedder
+        self.chunker = chunker
+        self.keyword_index = keyword_index
 
     def message(self, text):
         """
@@ -25,13 +43,47 @@ class GenerateMemo:
         if self.message_output:
             self.message_output(text)
 
+    def emit(self, event):
+        """
+        Utility method to output pipeline events
+        """
+        if self.event_output:
+            self.event_output(event)
+
+    def _generate_memo_text(self, prompt, generation_config):
+        """
+        Generate the memo with Gemini, streaming it as MemoToken events when events are requested.
+        Args:
+            prompt (str): System instruction of the memo.
+            generation_config (dict): Generation parameters.
+
+        Returns:
+            str: The memo text.
+        """
+        if self.event_output and hasattr(self.gemini_client, "generate_stream"):
+            # Stream the memo so its first sections reach the user while the rest is generated
+            pieces = []
+            for piece in self.gemini_client.generate_stream(
+                self.answer_list,
+                system_instruction=prompt,
+                generation_config=generation_config,
+                timeout=300
+            ):
+                pieces.append(piece)
+                self.emit(MemoToken(piece))
+            return "".join(pieces)
+        return self.gemini_client.generate(
+            self.answer_list,
+            system_instruction=prompt,
+            generation_config=generation_config,
+            timeout=300
+        )
+
     def generate_memo(self, query, questions_str):
 
         self.message("🙌🏼 Putting everything together ...") 
         self.message("🤖 Generating policy memo that summarizes the findings ...")  
 
-        genai.configure(api_key=gemini_api_key)
-        
         # GEMINI SET UP
         generation_config = {
             "temperature": 0.2,
@@ -52,68 +104,59 @@ class GenerateMemo:
         # Replace {query} in the template with the value of query
         prompt = template.format(query=query, questions = questions_str)
 
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
-            system_instruction=prompt
-        )
-        response = model.generate_content(self.answer_list)
-
-        response = response.text
+        with self.tracer.stage("memo", counters=llm_counters(self.gemini_client)) as counts:
+            response = self._generate_memo_text(prompt, generation_config)
+            counts["characters"] = len(response)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        memo_file = f"memo_{timestamp}.md"
+        memo_file = self.manifest.path_for("memo.md")
 
         # Write the response to the file
         with open(memo_file, "w") as file:
             file.write(response)
+        self.manifest.add_artifact("memo", memo_file)
         
         print(f"Memo saved to {memo_file}")
         self.message(f"🗃️ Memo file saved to {memo_file}.") 
 
-        return 
+        return memo_file
     
-    def run(self, all_external_content, content_by_title, user_query):
+    def run(self, all_external_content, content_by_title, user_query, relevant_papers=None):
+        """
+        Generate and answer the comparison questions, then write the memo.
+        Args:
+            all_external_content (list): Content of the external papers.
+            content_by_title (dict): Content of the external papers, keyed by title.
+            user_query (str): The research question of the user.
+            relevant_papers (list): Papers selected for the analysis, best first.
+                Defaults to the papers of the run's combined report.
+
+        Returns:
+            Path: Path to the memo, or None if no questions could be generated.
+        """
+        answer = QuestionAnswerer(
+            message_output=self.message_output, pdf_text_store=self.pdf_text_store, registry=self.registry,
+            embedding_backend=self.embedding_backend, gemini_client=self.gemini_client, manifest=self.manifest,
+            event_output=self.event_output, tracer=self.tracer,
+            embedder=self.embedder, chunker=self.chunker, keyword_index=self.keyword_index
+        )
+        answers = answer.run(
+            user_query=user_query,
+            all_external_content=all_external_content,
+            external_content_by_title=content_by_title,
+            relevant_papers=relevant_papers
+        )
+        if answer.questions_list is None:
+            print("No comparison questions available.")
+            return None
 
-        answer = QuestionAnswerer(message_output=self.message_output)
-        answer.run(user_query=user_query, all_external_content= all_external_content, external_content_by_title =  content_by_title)
-        
-        current_dir = Path(__file__).resolve().parent
-        # Navigate to the parent directory and then to the target file
-        file_path = current_dir.parent.parent / 'paper_answers.json'
-        
-        with open(file_path, 'r') as f:
-            answer_list = json.load(f)
-        
-        answer_list = str(answer_list)
-        
+        self.answer_list = str(answers)
+        question_str = str(answer.questions_list)
 
-        self.answer_list = answer_list
-        print("Aaaaaanswer", self.answer_list)
-
-        try:
-            # Define the directory containing the files
-            parent_dir = parent_dir = Path(os.getcwd()) # Go one level up from the current script's location
-            files = list(parent_dir.glob("comparison_questions_*.txt"))
-            
-            if not files:
-                print("No comparison questions files found.")
-                return None
-            
-            # Sort files by modification time in descending order
-            latest_questions_file = max(files, key=lambda f: f.stat().st_mtime)
-        
-        except Exception as e:
-            print(f"Error accessing directory: {e}")
- 
-        # Read the file content as a string
-        try:
-            with open(latest_questions_file, 'r', encoding='utf-8') as f:
-                question_str = f.read()  # Read the entire file as a string
-        except Exception as e:
-            print(f"\nError reading questions file: {e}")
+        memo_file = self.generate_memo(user_query, question_str)
 
-        self.generate_memo(user_query, question_str)
+        if self.gemini_client.llm_cache is not None:
+            print(f"LLM response cache: {self.gemini_client.llm_cache.stats()}")
+        return memo_file
 
 
 def main():
@@ -135,7 +178,7 @@ def main():
     
 
     memo = GenerateMemo()
-    memo.run(all_external_content, content_by_title, user_query)
+    memo.run(all_external_content, content_by_title, user_query, relevant_papers=list(content_by_title))
 
 
 
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from retriever.DiskCache import DiskCache, DEFAULT_CACHE_DIR
+
+
+class LLMCacheMiss(Exception):
+    """Raised in offline mode when a response is not in the cache."""
+
+
+class LLMUsage:
+    def __init__(self):
+        """
+        Initialize thread-safe counters of the requests an LLM client actually sent and the tokens they used.
+        Cached responses are not counted, since they cost no tokens.
+        """
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens=0, output_tokens=0):
+        """
+        Count one request.
+        Args:
+            input_tokens (int): Prompt tokens reported by the API. None counts as 0.
+            output_tokens (int): Generated tokens reported by the API. None counts as 0.
+        """
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += input_tokens or 0
+            self.output_tokens += output_tokens or 0
+
+    def stats(self):
+        """
+        Get the counters.
+        Returns:
+            dict: Number of requests, input tokens and output tokens.
+        """
+        with self._lock:
+            return {"requests": self.requests, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+
+
+class LLMCache:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, ttl=7 * 24 * 3600, max_entries=50000, offline=None):
+        """
+        Initialize a persistent cache of LLM responses.
+        Responses are keyed by provider, model, generation config and a hash of the full prompt and input,
+        so a repeated call returns the stored text without contacting the API.
+        Args:
+            path (str): Path to the SQLite cache file. Defaults to .cache/llm_responses.sqlite in the repository.
+            ttl (float): Seconds after which a response is considered stale and requested again. None never expires.
+                Ignored in offline mode.
+            max_entries (int): Maximum number of responses kept on disk before LRU eviction.
+            offline (bool): Whether to replay cached responses only and fail on a miss instead of calling the API.
+                Defaults to the LLM_CACHE_OFFLINE environment variable.
+        """
+        self.store = DiskCache(path or DEFAULT_CACHE_DIR / "llm_responses.sqlite", max_entries=max_entries)
+        self.ttl = ttl
+        if offline is None:
+            offline = os.getenv("LLM_CACHE_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Get the process-wide cache.
+        Returns:
+            LLMCache: The cache used by every LLM client that is not given one explicitly.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def key(self, provider, model, config, prompt):
+        """
+        Build the cache key for a request.
+        Args:
+            provider (str): API provider, e.g. 'gemini' or 'openai'.
+            model (str): Model name.
+            config (dict): Generation parameters of the request.
+            prompt (object): Everything sent to the model: system instruction, messages and contents.
+
+        Returns:
+            str: The cache key.
+        """
+        payload = json.dumps({"config": config, "prompt": prompt}, sort_keys=True, default=str)
+        prompt_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{provider}|{model}|{prompt_hash}"
+
+    def get(self, key):
+        """
+        Look up a response, ignoring it if it is older than the TTL. In offline mode stale responses are
+        still returned, since they cannot be requested again and replaying them is the point of the mode.
+        Args:
+            key (str): Key returned by key().
+
+        Returns:
+            str: The cached response, or None on a miss.
+        """
+        value = self.store.get(key)
+        entry = json.loads(value) if value is not None else None
+        if entry is not None and not self.offline and self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry["response"] if entry is not None else None
+
+    def set(self, key, response):
+        """
+        Store a response.
+        Args:
+            key (str): Key returned by key().
+            response (str): Text returned by the model.
+        """
+        self.store.set(key, json.dumps({"created": time.time(), "response": response}).encode("utf-8"))
+
+    def get_or_call(self, provider, model, config, prompt, call):
+        """
+        Return the cached response for a request, calling the model only on a miss.
+        Args:
+            provider (str): API provider, e.g. 'gemini' or 'openai'.
+            model (str): Model name.
+            config (dict): Generation parameters of the request.
+            prompt (object): Everything sent to the model.
+            call (callable): Function performing the request and returning the response text.
+
+        Returns:
+            str: The response text.
+
+        Raises:
+            LLMCacheMiss: In offline mode, if the response is not cached.
+        """
+        key = self.key(provider, model, config, prompt)
+        response = self.get(key)
+        if response is not None:
+            return response
+        if self.offline:
+            raise LLMCacheMiss(f"No cached {provider} response for model '{model}' and offline mode is enabled.")
+        response = call()
+        if response:
+            self.set(key, response)
+        return response
+
+    def stats(self):
+        """
+        Get hit and miss counters for this cache instance.
+        Returns:
+            dict: Number of hits, misses and the hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def llm_counters(client):
+    """
+    Get the counters of an LLM client to record in a traced stage.
+    Args:
+        client (object): A GeminiClient, NaiveQuestions or any object with optional usage and llm_cache attributes.
+
+    Returns:
+        dict: Functions returning the token usage and response cache counters, keyed by label.
+    """
+    counters = {}
+    if hasattr(client, "usage"):
+        counters["llm"] = client.usage.stats
+    if getattr(client, "llm_cache", None) is not None:
+        counters["llm_cache"] = client.llm_cache.stats
+    return counters
+
+
+if __name__ == "__main__":
+    print("Testing LLMCache functionality...")
+
+    cache = LLMCache()
+    print(f"Offline mode: {cache.offline}")
+    first = cache.get_or_call("demo", "echo", {}, "hello", lambda: "hello back")
+    second = cache.get_or_call("demo", "echo", {}, "hello", lambda: "not called")
+    print(f"Responses: {first!r}, {second!r}")
+    print(f"Stats: {cache.stats()}")
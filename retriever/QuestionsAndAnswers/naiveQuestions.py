@@ -1,10 +1,11 @@
-from pathlib import Path
 import json
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from datetime import datetime
 import ast
+from retriever.PaperRanker import PaperRanker
+from retriever.RunManifest import RunManifest
+from retriever.QuestionsAndAnswers.llmCache import LLMCache, LLMCacheMiss, LLMUsage
 
 
 
@@ -15,68 +16,30 @@ gemini_api_key = os.getenv("GEMINI_API_KEY")
 
 
 class NaiveQuestions:
-    def __init__(self):
-        #Initialize the OpenAI client
-        self.client = OpenAI(api_key=open_ai_api_key)
-        if not self.client.api_key:
-            raise ValueError("Please set the OPENAI_API_KEY environment variable")
-        
-        #Use the exact path where query_results exists
-        self.PROJECT_DIR = Path(r".")
-
-    def debug_directory_contents(self):
-        """Debug function to list directory contents"""
-        print("\nDebugging Directory Contents:")
-        print(f"Checking directory: {self.PROJECT_DIR}")
-        print("Files in directory:")
-        for item in self.PROJECT_DIR.iterdir():
-            print(f"- {item.name}")
-            if item.is_dir():
-                print("  Subdirectory contents:")
-                try:
-                    for subitem in item.iterdir():
-                        print(f"  - {subitem.name}")
-                except Exception as e:
-                    print(f"  Error reading subdirectory: {e}")
-
-    def get_latest_query_results_file(self):
-        """Find the most recent query results file."""
-        try:
-            # First try looking in the main directory
-            files = list(self.PROJECT_DIR.glob("combined_report_*.jsonl"))
-            
-            if not files:
-                # If not found, try looking in a query_results subdirectory
-                query_results_dir = self.PROJECT_DIR / "combined_report"
-                if query_results_dir.exists():
-                    files = list(query_results_dir.glob("*.jsonl"))
-            
-            if not files:
-                self.debug_directory_contents()
-                print("No combined report JSONl files found.")
-                return None
-            
-            # Sort files by modification time in descending order
-            latest_file = max(files, key=lambda f: f.stat().st_mtime)
-            print(f"Found latest file: {latest_file}")
-            return latest_file
-        
-        except Exception as e:
-            print(f"Error accessing directory: {e}")
-            self.debug_directory_contents()
-            return None
+    def __init__(self, llm_cache=None, manifest=None):
+        # Responses are cached; in offline mode they are only replayed, so no OpenAI client is needed
+        self.llm_cache = llm_cache or LLMCache.shared()
+        # Requests and tokens sent to the OpenAI API
+        self.usage = LLMUsage()
+        self.client = None
+        if not self.llm_cache.offline:
+            #Initialize the OpenAI client
+            self.client = OpenAI(api_key=open_ai_api_key)
+            if not self.client.api_key:
+                raise ValueError("Please set the OPENAI_API_KEY environment variable")
+        # Run whose manifest locates the combined report and receives the questions
+        # Required, so a stage never creates a run directory of its own
+        if manifest is None:
+            raise ValueError("NaiveQuestions needs the RunManifest of the run it belongs to")
+        self.manifest = manifest
 
     def load_relevant_papers(self, filename):
         """Load query results from a JSONL file and extract unique sources."""
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                # Read the JSONL file line by line
-                query_results = [json.loads(line) for line in file]
-            
+            # Read only the selected papers, not every chunk of the report
+            unique_sources = PaperRanker.read_relevant_papers(filename)
             print(f"Successfully loaded query results from {filename}")
             
-            # Extract unique sources
-            unique_sources = {entry["Source"] for entry in query_results}
             print(f"Number of relevant sources found: {len(unique_sources)}")
             
             return unique_sources
@@ -95,88 +58,111 @@ class NaiveQuestions:
             # Extract topic
             prompt = "What is the general topic of this query? give it in 3 words: {}".format(user_query)
 
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": prompt}#,
-                ],
-                max_tokens=30,
-                temperature=0.5
-            )
-
-            topic = response.choices[0].message.content.strip()
+            topic = self.chat_completion(
+                [{"role": "system", "content": prompt}],
+                max_tokens=30
+            ).strip()
 
             # Prompt
             prompt = "Create {} questions that can be allow a thorough comparison of findings, methodologies, and conclusions among policy and econometric papers on the topic of '{}'. Note that the questions will be individually asked to each paper. Format the output as a python list of strings that looks like this [question 1, question 2, ...] in which each element only contains the question, no enumeration. Make sure that the output is a python list".format(question_number, topic)
             
             # Call OpenAI with the new API format
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": prompt}#,
-                    #{"role": "user", "content": context}
-                ],
-                max_tokens=300,
-                temperature=0.5
-            )
-
-            # Extract the generated questions from the response using the new format
-            questions = response.choices[0].message.content.strip()
+            questions = self.chat_completion(
+                [{"role": "system", "content": prompt}],
+                max_tokens=300
+            ).strip()
             return questions
         
+        except LLMCacheMiss:
+            # Not an API error: the caller reports that the offline cache is incomplete
+            raise
         except Exception as e:
             return f"Error generating questions: {e}"
 
 
-    def run(self, user_query):
-        """Main function to load results and generate questions."""
+    def chat_completion(self, messages, max_tokens, model="gpt-3.5-turbo", temperature=0.5):
+        """Call the OpenAI chat API through the LLM response cache and return the message content."""
+        config = {"max_tokens": max_tokens, "temperature": temperature}
+        return self.llm_cache.get_or_call(
+            "openai",
+            model,
+            config,
+            messages,
+            lambda: self._create_completion(model, messages, config)
+        )
+
+    def _create_completion(self, model, messages, config):
+        """Call the OpenAI chat API, count the tokens it reports and return the message content."""
+        response = self.client.chat.completions.create(model=model, messages=messages, **config)
+        usage = getattr(response, "usage", None)
+        self.usage.add(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        return response.choices[0].message.content
+
+    def run(self, user_query, relevant_papers=None):
+        """
+        Generate the naive comparison questions for the papers selected in this run.
+        Args:
+            user_query (str): The query of the user.
+            relevant_papers (list): Sources of the selected papers. Read from the run's combined report if omitted.
+
+        Returns:
+            tuple: The relevant paper IDs and the list of questions, or an empty list and None on failure.
+        """
         print(f"\nStarting script to generate naive questions...")
-        print(f"\nLooking for query results in: {self.PROJECT_DIR}")
-        
-        # Find the latest query results file
-        latest_file = self.get_latest_query_results_file()
-        
-        if not latest_file:
-            print("\nNo combined report available.")
-            return
-        
-        print(f"\nUsing latest combined report file to generate naive questions: {latest_file}")
 
-        # Load set of relevant papers
-        relevant_papers_ids = self.load_relevant_papers(latest_file)
+        relevant_papers_ids = relevant_papers
+        if relevant_papers_ids is None:
+            report_file = self.manifest.artifact_path("combined_report")
+            if report_file is None or not report_file.exists():
+                print(f"\nNo combined report recorded for run {self.manifest.run_id}.")
+                return [], None
+
+            print(f"\nUsing combined report of run {self.manifest.run_id} to generate naive questions: {report_file}")
+            # Load set of relevant papers
+            relevant_papers_ids = self.load_relevant_papers(report_file)
         if not relevant_papers_ids:
-            return
+            return [], None
         
         
         # Generate comparison questions
         print("\nGenerating and saving naive comparison questions for this topic...")
-        comparison_questions = self.generate_comparison_questions(user_query=user_query, question_number=3, relevant_papers_ids=relevant_papers_ids)
-        
+        try:
+            comparison_questions = self.generate_comparison_questions(user_query=user_query, question_number=3, relevant_papers_ids=relevant_papers_ids)
+        except LLMCacheMiss as e:
+            print(f"\nCannot generate naive questions: {e} Run once with LLM_CACHE_OFFLINE unset to record the responses.")
+            return [], None
+
+        # The response is expected to be a python list; error messages and malformed output are reported instead
+        try:
+            comparison_questions = ast.literal_eval(comparison_questions)
+        except (ValueError, SyntaxError):
+            comparison_questions = None
+        if not isinstance(comparison_questions, list):
+            print("\nCould not generate naive questions, the response is not a list of questions.")
+            return [], None
+
         # Add questions related to time and place
-        comparison_questions = ast.literal_eval(comparison_questions)
         comparison_questions.insert(0, "When was this paper writen?")
         comparison_questions.insert(0, "What is the main place where this paper is refering to?")
         comparison_questions.insert(0, "What is the title of the paper?")
 
-        comparison_questions = str(comparison_questions)
-
-        # Save the generated questions
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        questions_file = self.PROJECT_DIR / f"comparison_questions_{timestamp}.txt"
+        # Save the generated questions in the run directory for inspection
+        questions_file = self.manifest.path_for("comparison_questions.txt")
 
         try:
             with open(questions_file, 'w', encoding='utf-8') as f:
-                f.write(comparison_questions)
+                f.write(str(comparison_questions))
+            self.manifest.add_artifact("comparison_questions", questions_file)
             print(f"\nGenerated questions saved to: {questions_file}")
             print("\nGenerated Comparison Questions:\n", comparison_questions)
         except Exception as e:
             print(f"\nError saving questions: {e}")
 
-        return relevant_papers_ids
+        return relevant_papers_ids, comparison_questions
         
 
 
 if __name__ == "__main__":
-    naive_questions = NaiveQuestions()
+    naive_questions = NaiveQuestions(manifest=RunManifest())
     user_query = "I am the mayor of SF and I want to create a policy that fosters financial inclusion on the mission district. I want to implement this from a gender perspective focused on women that are substance users"
-    relevant_papers_ids = naive_questions.run(user_query=user_query)
+    relevant_papers_ids, questions = naive_questions.run(user_query=user_query)
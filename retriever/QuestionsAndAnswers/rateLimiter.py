@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, requests_per_minute=60, burst=None):
+        """
+        Initialize a thread-safe token-bucket rate limiter shared by concurrent API callers.
+        Args:
+            requests_per_minute (float): Sustained number of requests allowed per minute.
+            burst (int): Maximum number of requests that can be made back to back. Defaults to ten seconds' worth, at least 1.
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, int(self.rate * 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Block until enough tokens are available, then take them.
+        Args:
+            tokens (int): Number of tokens to take.
+            timeout (float): Maximum number of seconds to wait. None waits as long as needed.
+
+        Returns:
+            bool: True if the tokens were taken, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait_time = (tokens - self.tokens) / self.rate
+
+            if deadline is not None and now + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
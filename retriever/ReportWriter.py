@@ -0,0 +1,92 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from retriever.PipelineResults import PaperScore, RetrievalResult, ScoredChunk
+from retriever.RunManifest import RunManifest
+
+
+class ReportWriter:
+    def __init__(self, manifest, enabled=True):
+        """
+        Initialize a writer that saves retrieval results as JSONL reports on a background thread.
+        Later stages receive the results in memory, so the reports are only a side output for inspection
+        and their encoding and disk I/O stay off the critical path of the pipeline.
+        Args:
+            manifest (RunManifest): Run whose directory receives the reports.
+            enabled (bool): Whether to write reports at all.
+        """
+        self.manifest = manifest
+        self.enabled = enabled
+        # A single worker keeps the reports of a run in submission order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-writer") if enabled else None
+        self.futures = []
+
+    def submit(self, result, report_name, include_url=False):
+        """
+        Queue a report for writing.
+        Args:
+            result (RetrievalResult): Selected papers and their best chunks.
+            report_name (str): Name of the report file.
+            include_url (bool): Whether to include URLs in the report (for external papers).
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the report path, or None if reports are disabled.
+        """
+        if not self.enabled:
+            return None
+        future = self.executor.submit(self.write, result, report_name, include_url)
+        self.futures.append(future)
+        return future
+
+    def write(self, result, report_name, include_url=False):
+        """
+        Write a JSONL report in the run directory and record it in the manifest.
+        The report starts with one line per selected paper, followed by the selected chunks.
+        Args:
+            result (RetrievalResult): Selected papers and their best chunks.
+            report_name (str): Name of the report file.
+            include_url (bool): Whether to include URLs in the report (for external papers).
+
+        Returns:
+            str: Path to the saved report.
+        """
+        sanitized_name = re.sub(r"[^a-zA-Z0-9_]", "_", report_name)
+        report_path = self.manifest.path_for(f"{sanitized_name}.jsonl")
+
+        with open(report_path, "w") as f:
+            for entry in result.papers + result.chunks:
+                json.dump(entry.to_report_line(include_url), f)
+                f.write("\n")
+
+        self.manifest.add_artifact(sanitized_name, report_path)
+        print(f"Report saved to {report_path}")
+        return str(report_path)
+
+    def flush(self):
+        """
+        Wait for the queued reports. Failed reports are logged, not raised, since the pipeline does not depend on them.
+        Returns:
+            list: Paths of the reports that were written.
+        """
+        if not self.enabled:
+            return []
+        paths = []
+        for future in self.futures:
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                print(f"Error writing report: {e}")
+        self.futures = []
+        return paths
+
+
+if __name__ == "__main__":
+    print("Testing ReportWriter functionality...")
+
+    writer = ReportWriter(RunManifest())
+    result = RetrievalResult(
+        papers=[PaperScore(source="paper.pdf", score=0.82, num_chunks=1, rank=1)],
+        chunks=[ScoredChunk(source="paper.pdf", content="Example chunk.", similarity=0.82)]
+    )
+    writer.submit(result, "example_report")
+    print(f"Reports written: {writer.flush()}")
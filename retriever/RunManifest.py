@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Default location of the run directories, next to the repository's papers folder
+DEFAULT_RUNS_DIR = Path(__file__).resolve().parent.parent / "runs"
+
+
+class RunManifest:
+    def __init__(self, run_id=None, runs_dir=None, metadata=None):
+        """
+        Create the directory and manifest of a pipeline run.
+        Every stage writes its outputs into the run directory and records them in manifest.json,
+        so later stages and the UI look artifacts up by name instead of searching for the newest file.
+        Args:
+            run_id (str): Identifier of the run. A timestamped unique ID is generated if omitted.
+            runs_dir (str): Folder holding the run directories. Defaults to runs/ in the repository.
+            metadata (dict): Extra information stored in the manifest, e.g. the user inputs.
+        """
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.run_dir = Path(runs_dir or DEFAULT_RUNS_DIR) / self.run_id
+        self.manifest_path = self.run_dir / "manifest.json"
+        self._lock = threading.Lock()
+
+        os.makedirs(self.run_dir, exist_ok=True)
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {
+                "run_id": self.run_id,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "metadata": metadata or {},
+                "artifacts": {}
+            }
+            self._save()
+
+    @classmethod
+    def load(cls, run_dir):
+        """
+        Open the manifest of an existing run.
+        Args:
+            run_dir (str): Path to the run directory.
+
+        Returns:
+            RunManifest: The manifest of that run.
+
+        Raises:
+            FileNotFoundError: If the directory holds no manifest.
+        """
+        run_dir = Path(run_dir)
+        if not (run_dir / "manifest.json").exists():
+            raise FileNotFoundError(f"No manifest found in '{run_dir}'.")
+        return cls(run_id=run_dir.name, runs_dir=run_dir.parent)
+
+    def path_for(self, filename):
+        """
+        Get the path of a file inside the run directory.
+        Args:
+            filename (str): Name of the file.
+
+        Returns:
+            Path: Path to the file.
+        """
+        return self.run_dir / filename
+
+    def add_artifact(self, name, path):
+        """
+        Record an artifact written by a stage.
+        Args:
+            name (str): Name under which later stages look the artifact up, e.g. 'combined_report'.
+            path (str): Path to the artifact.
+        """
+        with self._lock:
+            self.data["artifacts"][name] = os.path.relpath(path, self.run_dir)
+            self._save()
+
+    def artifact_path(self, name):
+        """
+        Look up an artifact recorded by an earlier stage.
+        Args:
+            name (str): Name of the artifact.
+
+        Returns:
+            Path: Path to the artifact, or None if it was not recorded.
+        """
+        with self._lock:
+            relative_path = self.data["artifacts"].get(name)
+        return self.run_dir / relative_path if relative_path is not None else None
+
+    def update(self, **fields):
+        """
+        Store additional information about the run, e.g. its status.
+        Args:
+            **fields: Keys and JSON-serializable values to add to the manifest.
+        """
+        with self._lock:
+            self.data.update(fields)
+            self._save()
+
+    def _save(self):
+        """
+        Write the manifest under a temporary name and rename it, so readers never see a partial file.
+        """
+        temp_path = self.manifest_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+
+if __name__ == "__main__":
+    print("Testing RunManifest functionality...")
+
+    manifest = RunManifest(metadata={"query": "example"})
+    report_path = manifest.path_for("example.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("example artifact")
+    manifest.add_artifact("example", report_path)
+    print(f"Run directory: {manifest.run_dir}")
+    print(f"Artifact path: {RunManifest.load(manifest.run_dir).artifact_path('example')}")
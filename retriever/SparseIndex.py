@@ -0,0 +1,223 @@
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+
+# Frequent English words that carry no meaning for retrieval
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "has", "have", "how",
+    "in", "is", "it", "of", "on", "or", "that", "the", "their", "this", "to", "was", "were", "what", "which", "with"
+}
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase terms for the sparse index. Numbers, place names and acronyms are kept as terms.
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The terms, in text order.
+    """
+    return [term for term in re.findall(r"\w+", text.lower()) if len(term) > 1 and term not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several rankings of the same items with reciprocal rank fusion.
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears in, with ranks starting at 1.
+    Args:
+        rankings (list): Rankings to fuse, each a list of item IDs, best first.
+        k (int): Damping constant. Larger values flatten the difference between the top ranks.
+
+    Returns:
+        list: Tuples of item ID and fused score, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+# Indexes used recently in this process, shared by every run, most recently used last
+_recent_indexes = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+class SparseIndex:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        """
+        Build a BM25 inverted index over a list of texts, e.g. the chunks of the selected papers.
+        Each term maps to the positions of the texts containing it and its frequency in each of them,
+        so a query only touches the postings of its own terms.
+        Args:
+            texts (list): Texts to index. A text is identified by its position in the list.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.num_texts = len(texts)
+        postings = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths[position] = len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(position)
+                postings[term][1].append(count)
+        self.lengths = lengths
+        self.average_length = float(lengths.mean()) if len(texts) else 0.0
+        self.postings = {
+            term: (np.asarray(positions, dtype=np.int64), np.asarray(counts, dtype=np.float32))
+            for term, (positions, counts) in postings.items()
+        }
+
+    @staticmethod
+    def key(texts, signature="", k1=1.5, b=0.75):
+        """
+        Identify a set of texts and the settings they are indexed with.
+        Args:
+            texts (list): Texts to index, in order.
+            signature (str): Description of how the texts were produced, e.g. the chunking settings.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+
+        Returns:
+            str: SHA-256 hex digest of the settings and every text.
+        """
+        digest = hashlib.sha256(json.dumps({"signature": signature, "k1": k1, "b": b}).encode("utf-8"))
+        for text in texts:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    @classmethod
+    def load_or_build(cls, texts, signature="", k1=1.5, b=0.75, cache_dir=None, max_in_memory=8, max_on_disk=32):
+        """
+        Get the index of a set of texts, building it only if the same texts were not indexed before.
+        Recently used indexes are kept in memory, and every index is saved on disk, so the chunks of the
+        local papers are tokenized once rather than for every query.
+        Args:
+            texts (list): Texts to index. A text is identified by its position in the list.
+            signature (str): Description of how the texts were produced, e.g. the chunking settings.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+            cache_dir (str): Folder holding saved indexes. Defaults to .cache/sparse_index in the repository.
+            max_in_memory (int): Number of indexes kept in memory.
+            max_on_disk (int): Number of indexes kept on disk. The least recently used ones are deleted.
+
+        Returns:
+            tuple: The SparseIndex and where it came from: 'memory', 'disk' or 'built'.
+        """
+        key = cls.key(texts, signature, k1, b)
+        with _recent_lock:
+            if key in _recent_indexes:
+                _recent_indexes.move_to_end(key)
+                return _recent_indexes[key], "memory"
+
+        path = Path(cache_dir or DEFAULT_CACHE_DIR / "sparse_index") / f"{key}.pickle"
+        source = "disk"
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            index = cls(texts, k1=k1, b=b)
+            source = "built"
+            # Write under a temporary name so an interrupted save is never loaded
+            os.makedirs(path.parent, exist_ok=True)
+            temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(temp_path, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            try:
+                saved = sorted(path.parent.glob("*.pickle"), key=lambda saved_path: saved_path.stat().st_mtime)
+            except FileNotFoundError:
+                # Another process pruned the folder at the same time
+                saved = []
+            for old_path in saved[:max(0, len(saved) - max_on_disk)]:
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+
+        with _recent_lock:
+            _recent_indexes[key] = index
+            while len(_recent_indexes) > max_in_memory:
+                _recent_indexes.popitem(last=False)
+        return index, source
+
+    def idf(self, term):
+        """
+        Get the inverse document frequency of a term.
+        Args:
+            term (str): A term returned by tokenize().
+
+        Returns:
+            float: The BM25 IDF, or 0 if no text contains the term.
+        """
+        if term not in self.postings:
+            return 0.0
+        frequency = len(self.postings[term][0])
+        return math.log(1 + (self.num_texts - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, query):
+        """
+        Score every text against a query.
+        Args:
+            query (str): The query.
+
+        Returns:
+            numpy.ndarray: BM25 score of each text, 0 for texts sharing no term with the query.
+        """
+        scores = np.zeros(self.num_texts, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            positions, counts = self.postings[term]
+            normalization = self.k1 * (1 - self.b + self.b * self.lengths[positions] / max(self.average_length, 1e-6))
+            scores[positions] += self.idf(term) * counts * (self.k1 + 1) / (counts + normalization)
+        return scores
+
+    def search(self, query, top_k=None):
+        """
+        Find the texts that best match a query.
+        Args:
+            query (str): The query.
+            top_k (int): Maximum number of results. All matching texts are returned if omitted.
+
+        Returns:
+            list: Tuples of text position and BM25 score, best first. Texts sharing no term with the query are left out.
+        """
+        scores = self.scores(query)
+        matching = np.flatnonzero(scores > 0)
+        order = matching[np.argsort(-scores[matching], kind="stable")]
+        if top_k is not None:
+            order = order[:top_k]
+        return [(int(position), float(scores[position])) for position in order]
+
+
+if __name__ == "__main__":
+    print("Testing SparseIndex functionality...")
+
+    texts = [
+        "MGNREGA guarantees 100 days of wage employment to rural households in India.",
+        "Mobile money adoption through M-Pesa increased savings of women in Kenya.",
+        "Conditional cash transfers such as Progresa raised school enrollment in Mexico.",
+    ]
+    index = SparseIndex(texts)
+    sparse_ranking = index.search("Effect of M-Pesa mobile money on women in Kenya")
+    print(sparse_ranking)
+    print(reciprocal_rank_fusion([[position for position, _ in sparse_ranking], [2, 1, 0]]))
@@ -0,0 +1,173 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # Optional: /proc is read instead on Linux
+    psutil = None
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of this process.
+    Returns:
+        float: Peak RSS in megabytes, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """
+    Get the current resident set size of this process.
+    Returns:
+        float: Current RSS in megabytes, or None where it cannot be measured.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def cpu_seconds():
+    """
+    Get the CPU time used so far by this process and its finished child processes, e.g. chunking workers.
+    Returns:
+        float: User and system CPU seconds.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageTracer:
+    def __init__(self, path=None, run_id=None):
+        """
+        Initialize a tracer that records the cost of each pipeline stage.
+        Every stage gets one JSON line with its wall time, CPU time, RSS growth, the process peak RSS so far,
+        item counts and the change in any counters it was given, e.g. LLM tokens or cache hits.
+        RSS growth is the change of the current RSS over the stage; a negative value means memory was released.
+        CPU time, RSS and counters are process-wide, so stages that overlap with other runs include their share.
+        Args:
+            path (str): JSONL file receiving the records, usually trace.jsonl in the run directory.
+                Records are only kept in memory if omitted.
+            run_id (str): ID of the run, added to every record.
+        """
+        self.path = path
+        self.run_id = run_id
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, counters=None, **fields):
+        """
+        Measure a stage.
+        Args:
+            name (str): Name of the stage, e.g. 'embedding' or 'answering'.
+            counters (dict): Functions returning dicts of numeric counters, keyed by a label. The record holds
+                the change of every counter over the stage, e.g. {"llm": client.usage.stats}.
+            **fields: Extra values stored in the record, e.g. scope='external'.
+
+        Yields:
+            dict: Item counts of the stage, filled in by the caller, e.g. counts["chunks"] = 120.
+        """
+        counters = counters or {}
+        before = {label: get_counters() for label, get_counters in counters.items()}
+        counts = {}
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+        rss_start = current_rss_mb()
+        error = None
+        try:
+            yield counts
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            rss_end = current_rss_mb()
+            peak_rss = peak_rss_mb()
+            record = {
+                "stage": name,
+                **fields,
+                "wall_s": round(time.perf_counter() - wall_start, 4),
+                "cpu_s": round(cpu_seconds() - cpu_start, 4),
+                "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+                "rss_growth_mb": round(rss_end - rss_start, 1) if rss_end is not None and rss_start is not None else None,
+                "counts": counts
+            }
+            for label, get_counters in counters.items():
+                record[label] = self._counter_delta(before[label], get_counters())
+            if error is not None:
+                record["error"] = error
+            self.add(record)
+
+    @staticmethod
+    def _counter_delta(before, after):
+        """
+        Subtract two counter snapshots. A hit rate is recomputed from the hits and misses of the stage.
+        Args:
+            before (dict): Counters at the start of the stage.
+            after (dict): Counters at the end of the stage.
+
+        Returns:
+            dict: The change of every numeric counter.
+        """
+        delta = {
+            key: after[key] - before.get(key, 0)
+            for key, value in after.items()
+            if isinstance(value, (int, float)) and key != "hit_rate"
+        }
+        if "hits" in delta and "misses" in delta:
+            lookups = delta["hits"] + delta["misses"]
+            delta["hit_rate"] = round(delta["hits"] / lookups, 4) if lookups else None
+        return delta
+
+    def add(self, record):
+        """
+        Store a record, including ones measured outside stage(), e.g. work done in worker processes.
+        Args:
+            record (dict): The record. Must contain a 'stage' key.
+        """
+        record = {"run_id": self.run_id, "time": round(time.time(), 3), **record}
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def load(path):
+        """
+        Read the records of a trace file.
+        Args:
+            path (str): Path to a trace.jsonl file.
+
+        Returns:
+            list: The records, in the order they were written.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    print("Testing StageTracer functionality...")
+
+    tracer = StageTracer(run_id="example")
+    with tracer.stage("example", scope="demo") as counts:
+        counts["items"] = len([i * i for i in range(1_000_000)])
+    print(tracer.records)
@@ -0,0 +1,519 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+import numpy as np
+from retriever.DiskCache import DEFAULT_CACHE_DIR
+
+# "qdrant": Qdrant server over HTTP or gRPC, "qdrant_local": Qdrant embedded in the process and stored on disk,
+# "mmap": float16 matrix memory-mapped from disk and searched with NumPy
+VECTOR_STORES = ("qdrant", "qdrant_local", "mmap")
+
+
+def resolve_vector_store(vector_store=None):
+    """
+    Pick the vector store from an explicit value or the VECTOR_STORE environment variable.
+    Args:
+        vector_store (str): Requested vector store. None falls back to VECTOR_STORE, then to 'qdrant'.
+
+    Returns:
+        str: The vector store name.
+
+    Raises:
+        ValueError: If the vector store is not supported.
+    """
+    vector_store = vector_store or os.getenv("VECTOR_STORE", "qdrant")
+    if vector_store not in VECTOR_STORES:
+        raise ValueError(f"Unsupported vector store '{vector_store}'. Choose one of {VECTOR_STORES}.")
+    return vector_store
+
+
+@dataclass
+class VectorHit:
+    """A chunk found by a vector search, with the same fields as a Qdrant search result."""
+    id: str
+    score: float
+    payload: dict = field(default_factory=dict)
+
+
+class VectorStore:
+    """
+    Collections of chunk vectors with a payload holding at least the chunk's paper_id.
+    Vectors are compared by cosine similarity.
+    """
+
+    def collection_exists(self, collection_name):
+        """
+        Check whether a collection exists.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            bool: True if the collection exists.
+        """
+        raise NotImplementedError
+
+    def create_collection(self, collection_name, vector_size):
+        """
+        Create an empty collection.
+        Args:
+            collection_name (str): Name of the collection.
+            vector_size (int): Size of the vectors.
+        """
+        raise NotImplementedError
+
+    def list_collections(self):
+        """
+        List the collections of the store.
+        Returns:
+            list: Collection names, sorted.
+        """
+        raise NotImplementedError
+
+    def drop_collection(self, collection_name):
+        """
+        Delete a collection and all its points. Does nothing if the collection does not exist.
+        Args:
+            collection_name (str): Name of the collection.
+        """
+        raise NotImplementedError
+
+    def collection_info(self, collection_name):
+        """
+        Describe a collection.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            dict: Size of the vectors and number of points.
+        """
+        return {"vector_size": self.vector_size(collection_name), "points": self.count(collection_name)}
+
+    def vector_size(self, collection_name):
+        """
+        Get the size of the vectors of a collection.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            int: Size of the vectors.
+        """
+        raise NotImplementedError
+
+    def count(self, collection_name):
+        """
+        Count the points of a collection.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            int: Number of points.
+        """
+        raise NotImplementedError
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        """
+        Insert points, replacing the points that have the same IDs.
+        Args:
+            collection_name (str): Name of the collection.
+            ids (list): Point IDs.
+            vectors (numpy.ndarray): One vector per point.
+            payloads (list): One payload dict per point, each with a 'paper_id' key.
+        """
+        raise NotImplementedError
+
+    def search(self, collection_name, vector, top_k=5, paper_ids=None):
+        """
+        Find the points most similar to a vector.
+        Args:
+            collection_name (str): Name of the collection.
+            vector (numpy.ndarray): Query vector.
+            top_k (int): Number of results.
+            paper_ids (list): If given, only points whose paper_id is in this list are searched.
+
+        Returns:
+            list: Hits with id, score and payload attributes, best first.
+        """
+        raise NotImplementedError
+
+    def delete_ids(self, collection_name, ids):
+        """
+        Delete points by ID.
+        Args:
+            collection_name (str): Name of the collection.
+            ids (list): Point IDs.
+        """
+        raise NotImplementedError
+
+    def delete_paper(self, collection_name, paper_id):
+        """
+        Delete every point of a paper.
+        Args:
+            collection_name (str): Name of the collection.
+            paper_id (str): ID of the paper.
+        """
+        raise NotImplementedError
+
+
+class QdrantVectorStore(VectorStore):
+    def __init__(self, client, payload_index=True):
+        """
+        Initialize a vector store backed by Qdrant.
+        Args:
+            client (QdrantClient): Client of a Qdrant server, or of a local Qdrant created with QdrantClient(path=...).
+            payload_index (bool): Whether new collections index the paper_id payload. Local Qdrant does not support it.
+        """
+        self.client = client
+        self.payload_index = payload_index
+
+    def collection_exists(self, collection_name):
+        return self.client.collection_exists(collection_name)
+
+    def create_collection(self, collection_name, vector_size):
+        from qdrant_client.models import PayloadSchemaType, VectorParams
+
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vector_size, distance="Cosine")
+        )
+        if self.payload_index:
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name="paper_id",
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+
+    def list_collections(self):
+        return sorted(collection.name for collection in self.client.get_collections().collections)
+
+    def drop_collection(self, collection_name):
+        if self.client.collection_exists(collection_name):
+            self.client.delete_collection(collection_name)
+
+    def vector_size(self, collection_name):
+        return self.client.get_collection(collection_name).config.params.vectors.size
+
+    def count(self, collection_name):
+        return self.client.count(collection_name).count
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        from qdrant_client.models import PointStruct
+
+        self.client.upsert(
+            collection_name=collection_name,
+            points=[
+                PointStruct(id=point_id, vector=np.asarray(vector).tolist(), payload=payload)
+                for point_id, vector, payload in zip(ids, vectors, payloads)
+            ]
+        )
+
+    def search(self, collection_name, vector, top_k=5, paper_ids=None):
+        from qdrant_client.models import FieldCondition, Filter, MatchAny
+
+        query_filter = None
+        if paper_ids is not None:
+            query_filter = Filter(must=[FieldCondition(key="paper_id", match=MatchAny(any=list(paper_ids)))])
+        return self.client.search(
+            collection_name=collection_name,
+            query_vector=np.asarray(vector).tolist(),
+            query_filter=query_filter,
+            limit=top_k
+        )
+
+    def delete_ids(self, collection_name, ids):
+        from qdrant_client.models import PointIdsList
+
+        self.client.delete(collection_name=collection_name, points_selector=PointIdsList(points=list(ids)))
+
+    def delete_paper(self, collection_name, paper_id):
+        from qdrant_client.models import FieldCondition, Filter, FilterSelector, MatchValue
+
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(
+                filter=Filter(must=[FieldCondition(key="paper_id", match=MatchValue(value=paper_id))])
+            )
+        )
+
+
+class MmapVectorStore(VectorStore):
+    def __init__(self, directory=None, block_rows=65536):
+        """
+        Initialize a vector store kept in local files and searched in-process.
+        Each collection is a folder with a float16 matrix of unit-length vectors (vectors.f16) and a SQLite table
+        mapping every point ID to its row, paper and payload (points.sqlite). The matrix is memory-mapped, so
+        opening a collection reads no vectors, and worker processes searching the same collection share its pages
+        in the OS page cache. A replaced point overwrites its row in place, and rows of deleted points are reused
+        by later inserts, so the matrix never grows beyond the largest number of points the collection held.
+        Args:
+            directory (str): Folder holding the collections. Defaults to .cache/vectors in the repository.
+            block_rows (int): Number of rows scored per NumPy block, which bounds the float32 working memory.
+        """
+        self.directory = str(directory or DEFAULT_CACHE_DIR / "vectors")
+        self.block_rows = block_rows
+        self._connections = {}
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def _path(self, collection_name, file_name):
+        """
+        Get the path of a file of a collection.
+        Args:
+            collection_name (str): Name of the collection.
+            file_name (str): Name of the file.
+
+        Returns:
+            str: The path.
+        """
+        return os.path.join(self.directory, collection_name, file_name)
+
+    def _connection(self, collection_name):
+        """
+        Get the SQLite connection of a collection. Must be called with the lock held.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        if collection_name not in self._connections:
+            connection = sqlite3.connect(
+                self._path(collection_name, "points.sqlite"), timeout=30, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Rows of deleted points, handed out to new points before the matrix grows. Created here too,
+            # so collections written before the table existed get it
+            connection.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+            self._connections[collection_name] = connection
+        return self._connections[collection_name]
+
+    def _setting(self, connection, key):
+        """
+        Read a value of the settings table of a collection.
+        Args:
+            connection (sqlite3.Connection): Connection of the collection.
+            key (str): Name of the setting.
+
+        Returns:
+            int: The value.
+        """
+        return connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()[0]
+
+    def collection_exists(self, collection_name):
+        return os.path.exists(self._path(collection_name, "points.sqlite"))
+
+    def create_collection(self, collection_name, vector_size):
+        os.makedirs(os.path.join(self.directory, collection_name), exist_ok=True)
+        with self._lock:
+            connection = self._connection(collection_name)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS points ("
+                "id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, paper_id TEXT NOT NULL, payload TEXT NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS points_paper_id ON points (paper_id)")
+            connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # 'rows' is the number of rows in vectors.f16, 'generation' changes with every write
+            connection.executemany(
+                "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                [("vector_size", vector_size), ("rows", 0), ("generation", 0)]
+            )
+            connection.commit()
+        open(self._path(collection_name, "vectors.f16"), "ab").close()
+
+    def list_collections(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if self.collection_exists(name))
+
+    def drop_collection(self, collection_name):
+        with self._lock:
+            connection = self._connections.pop(collection_name, None)
+            if connection is not None:
+                connection.close()
+            self._views.pop(collection_name, None)
+            shutil.rmtree(os.path.join(self.directory, collection_name), ignore_errors=True)
+
+    def vector_size(self, collection_name):
+        with self._lock:
+            return self._setting(self._connection(collection_name), "vector_size")
+
+    def count(self, collection_name):
+        with self._lock:
+            return self._connection(collection_name).execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # Unit-length vectors turn cosine similarity into a dot product
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        with self._lock:
+            connection = self._connection(collection_name)
+            # An immediate transaction also serializes writers in other processes
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                vector_size = self._setting(connection, "vector_size")
+                if vectors.shape[1] != vector_size:
+                    raise ValueError(f"Collection '{collection_name}' holds vectors of size {vector_size}, got {vectors.shape[1]}.")
+                num_rows = self._setting(connection, "rows")
+                ids = [str(point_id) for point_id in ids]
+                existing = {}
+                # SQLite limits the number of bound parameters, so query in slices
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    existing.update(connection.execute(
+                        f"SELECT id, row FROM points WHERE id IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall())
+                num_new = len(set(ids) - set(existing))
+                free_rows = [row for row, in connection.execute(
+                    "SELECT row FROM free_rows ORDER BY row LIMIT ?", (num_new,)
+                )]
+                connection.executemany("DELETE FROM free_rows WHERE row = ?", [(row,) for row in free_rows])
+                rows = []
+                for point_id in ids:
+                    if point_id not in existing:
+                        if free_rows:
+                            existing[point_id] = free_rows.pop(0)
+                        else:
+                            existing[point_id] = num_rows
+                            num_rows += 1
+                    rows.append(existing[point_id])
+
+                with open(self._path(collection_name, "vectors.f16"), "r+b") as f:
+                    f.truncate(max(os.fstat(f.fileno()).st_size, num_rows * vector_size * 2))
+                    for row, vector in zip(rows, vectors.astype(np.float16)):
+                        f.seek(row * vector_size * 2)
+                        f.write(vector.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                connection.executemany(
+                    "INSERT OR REPLACE INTO points (id, row, paper_id, payload) VALUES (?, ?, ?, ?)",
+                    [
+                        (point_id, row, payload["paper_id"], json.dumps(payload))
+                        for point_id, row, payload in zip(ids, rows, payloads)
+                    ]
+                )
+                connection.execute("UPDATE settings SET value = ? WHERE key = 'rows'", (num_rows,))
+                connection.execute("UPDATE settings SET value = value + 1 WHERE key = 'generation'")
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def _view(self, collection_name):
+        """
+        Get the memory-mapped matrix and the live rows of a collection, reopening them only after a write.
+        Must be called with the lock held.
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            tuple: The float16 matrix, the row of every point and the paper ID of every point.
+        """
+        connection = self._connection(collection_name)
+        generation = self._setting(connection, "generation")
+        view = self._views.get(collection_name)
+        if view is None or view[0] != generation:
+            vector_size = self._setting(connection, "vector_size")
+            num_rows = self._setting(connection, "rows")
+            matrix = np.zeros((0, vector_size), dtype=np.float16)
+            if num_rows:
+                matrix = np.memmap(
+                    self._path(collection_name, "vectors.f16"), dtype=np.float16, mode="r",
+                    shape=(num_rows, vector_size)
+                )
+            points = connection.execute("SELECT row, paper_id FROM points ORDER BY row").fetchall()
+            rows = np.fromiter((row for row, _ in points), dtype=np.int64, count=len(points))
+            paper_ids = np.array([paper_id for _, paper_id in points], dtype=object)
+            view = (generation, matrix, rows, paper_ids)
+            self._views[collection_name] = view
+        return view[1:]
+
+    def search(self, collection_name, vector, top_k=5, paper_ids=None):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            matrix, rows, row_paper_ids = self._view(collection_name)
+        if paper_ids is not None:
+            rows = rows[np.isin(row_paper_ids, list(paper_ids))]
+        if len(rows) == 0:
+            return []
+
+        # Score in blocks, so only block_rows float32 rows are materialized at a time
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            if len(block) == matrix.shape[0]:
+                # Every row is live and in order, so the mapped matrix is read without gathering
+                scores[start:start + len(block)] = np.asarray(matrix, dtype=np.float32) @ vector
+            else:
+                scores[start:start + len(block)] = matrix[block].astype(np.float32) @ vector
+        top_k = min(top_k, len(rows))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        best_rows = [int(row) for row in rows[best]]
+        with self._lock:
+            connection = self._connection(collection_name)
+            placeholders = ",".join("?" * len(best_rows))
+            found = {
+                row: (point_id, json.loads(payload))
+                for row, point_id, payload in connection.execute(
+                    f"SELECT row, id, payload FROM points WHERE row IN ({placeholders})", best_rows
+                )
+            }
+        return [
+            VectorHit(id=found[row][0], score=float(score), payload=found[row][1])
+            for row, score in zip(best_rows, scores[best]) if row in found
+        ]
+
+    def _delete(self, collection_name, where, parameters):
+        """
+        Delete the points matching a condition and free their rows for later inserts.
+        Args:
+            collection_name (str): Name of the collection.
+            where (str): SQL condition on the points table.
+            parameters (list): Parameters of the condition.
+        """
+        with self._lock:
+            connection = self._connection(collection_name)
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(f"INSERT OR IGNORE INTO free_rows (row) SELECT row FROM points WHERE {where}", parameters)
+                connection.execute(f"DELETE FROM points WHERE {where}", parameters)
+                connection.execute("UPDATE settings SET value = value + 1 WHERE key = 'generation'")
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def delete_ids(self, collection_name, ids):
+        ids = [str(point_id) for point_id in ids]
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            self._delete(collection_name, f"id IN ({','.join('?' * len(batch))})", batch)
+
+    def delete_paper(self, collection_name, paper_id):
+        self._delete(collection_name, "paper_id = ?", [paper_id])
+
+
+if __name__ == "__main__":
+    print("Testing VectorStore functionality...")
+
+    import tempfile
+    import time
+
+    store = MmapVectorStore(tempfile.mkdtemp())
+    store.create_collection("example", vector_size=384)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20000, 384)).astype(np.float32)
+    store.upsert(
+        "example",
+        [f"point-{i}" for i in range(len(vectors))],
+        vectors,
+        [{"paper_id": f"paper-{i % 100}", "chunk_text": f"chunk {i}"} for i in range(len(vectors))]
+    )
+    start = time.perf_counter()
+    hits = MmapVectorStore(store.directory).search("example", vectors[42], top_k=3)
+    print(f"Opened and searched {store.count('example')} vectors in {time.perf_counter() - start:.3f}s: {hits}")
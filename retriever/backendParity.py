@@ -0,0 +1,112 @@
+import argparse
+import sys
+import time
+import numpy as np
+from retriever.Chunkenizer import Chunkenizer
+from retriever.EmbeddingBackend import BACKENDS
+from retriever.Embbedingator import Embbedingator
+
+DEFAULT_QUERIES = [
+    "Effect of mobile banking on financial inclusion of women",
+    "Impact of deworming programs on child health and schooling",
+    "Racial discrimination in municipal borrowing costs",
+    "Community health workers and child mortality",
+    "Long-term effects of early childhood education programs",
+]
+
+
+def normalize(vectors):
+    """
+    Scale vectors to unit length so dot products are cosine similarities.
+    Args:
+        vectors (numpy.ndarray): Array of shape (n, dim).
+
+    Returns:
+        numpy.ndarray: The normalized vectors.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def embed_with_backend(backend, model_name, chunks, queries, batch_size):
+    """
+    Embed the corpus and the queries with one backend.
+    Args:
+        backend (str): Embedding backend.
+        model_name (str): The Hugging Face model name.
+        chunks (list): Chunk texts.
+        queries (list): Query texts.
+        batch_size (int): Number of texts per forward pass.
+
+    Returns:
+        tuple: Normalized chunk vectors, normalized query vectors and chunk throughput in chunks per second.
+    """
+    embbedingator = Embbedingator(model_name=model_name, use_cache=False, backend=backend)
+    # Warm up so the one-off export or quantization is not counted in the throughput
+    embbedingator.embed_texts(chunks[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    chunk_vectors = embbedingator.embed_texts(chunks, batch_size=batch_size)
+    throughput = len(chunks) / (time.perf_counter() - start)
+    query_vectors = embbedingator.embed_texts(queries, batch_size=batch_size)
+    return normalize(chunk_vectors), normalize(query_vectors), throughput
+
+
+def compare_rankings(reference, candidate, top_k):
+    """
+    Compare the cosine rankings of the chunks for every query.
+    Args:
+        reference (tuple): Chunk and query vectors of the reference backend.
+        candidate (tuple): Chunk and query vectors of the candidate backend.
+        top_k (int): Size of the compared top of the ranking.
+
+    Returns:
+        list: Overlap between the reference and candidate top-k chunks, one value in [0, 1] per query.
+    """
+    reference_scores = reference[1] @ reference[0].T
+    candidate_scores = candidate[1] @ candidate[0].T
+    overlaps = []
+    for reference_row, candidate_row in zip(reference_scores, candidate_scores):
+        reference_top = set(np.argsort(-reference_row)[:top_k])
+        candidate_top = set(np.argsort(-candidate_row)[:top_k])
+        overlaps.append(len(reference_top & candidate_top) / top_k)
+    return overlaps
+
+
+if __name__ == "__main__":
+    print("Testing embedding backend parity...")
+
+    parser = argparse.ArgumentParser(description="Check that alternative embedding backends preserve cosine rankings.")
+    parser.add_argument("--papers-folder", default="papers")
+    parser.add_argument("--model-name", default="BAAI/bge-small-en")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"], choices=BACKENDS)
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-overlap", type=float, default=0.8, help="Minimum mean top-k overlap with fp32.")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Minimum mean cosine to the fp32 vectors.")
+    args = parser.parse_args()
+
+    chunkenizer = Chunkenizer(args.papers_folder)
+    chunks = []
+    for _, paper_chunks in chunkenizer.process_files(chunkenizer.list_files()):
+        chunks.extend(paper_chunks)
+    chunks = chunks[:args.max_chunks]
+    print(f"Comparing backends on {len(chunks)} chunks and {len(DEFAULT_QUERIES)} queries")
+
+    reference = embed_with_backend("transformers", args.model_name, chunks, DEFAULT_QUERIES, args.batch_size)
+    print(f"transformers: {reference[2]:.1f} chunks/s")
+
+    failed = False
+    for backend in args.backends:
+        candidate = embed_with_backend(backend, args.model_name, chunks, DEFAULT_QUERIES, args.batch_size)
+        vector_cosines = np.sum(reference[0] * candidate[0], axis=1)
+        overlaps = compare_rankings(reference, candidate, min(args.top_k, len(chunks)))
+        passed = np.mean(vector_cosines) >= args.min_cosine and np.mean(overlaps) >= args.min_overlap
+        failed = failed or not passed
+        print(
+            f"{backend}: {candidate[2]:.1f} chunks/s ({candidate[2] / reference[2]:.2f}x), "
+            f"mean cosine to fp32 {np.mean(vector_cosines):.4f} (min {np.min(vector_cosines):.4f}), "
+            f"mean top-{args.top_k} overlap {np.mean(overlaps):.2f} (min {np.min(overlaps):.2f}) "
+            f"-> {'PASS' if passed else 'FAIL'}"
+        )
+    sys.exit(1 if failed else 0)
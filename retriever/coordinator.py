@@ -1,54 +1,140 @@
 import json
 import os
-import re
 import datetime
+import numpy as np
 import requests
 from retriever.Chunkenizer import Chunkenizer
 from retriever.Embbedingator import Embbedingator
+from retriever.IncrementalIndexer import IncrementalIndexer
+from retriever.KeywordIndex import KeywordIndex
+from retriever.SparseIndex import SparseIndex, reciprocal_rank_fusion
+from retriever.ModelRegistry import ModelRegistry
+from retriever.PaperRanker import PaperRanker
 from retriever.PerformQuery import PerformQuery
-from retriever.QuestionsAndAnswers.generateMemo import GenerateMemo
+from retriever.PdfTextStore import PdfTextStore
+from retriever.PipelineEvents import ChunksScored, PapersSelected, StageMessage
+from retriever.PipelineResults import ScoredChunk
+from retriever.ReportWriter import ReportWriter
+from retriever.StageTracer import StageTracer
+from retriever.RunManifest import RunManifest
 from pathlib import Path 
 
 
 
 class Coordinator:
-    def __init__(self,  message_output=None):
+    def __init__(self,  message_output=None, registry=None, user_inputs=None):
         """
         Initialize the Coordinator with user inputs and pipeline components.
         Args:
-            user_inputs_file (str): Path to the JSON file containing user inputs.
+            message_output (callable): Receives the progress messages. Defaults to print.
+            registry (ModelRegistry): Registry holding the loaded models and clients, shared across runs.
+                Defaults to the process-wide registry.
+            user_inputs (dict): Inputs of this run. Read from user_inputs.json in the repository when omitted,
+                which is only safe when a single run happens at a time.
         """
-        # Get the current script's directory
-        current_dir = Path(__file__).resolve().parent
+        if user_inputs is None:
+            # Get the current script's directory
+            current_dir = Path(__file__).resolve().parent
 
-        # Navigate to the parent directory and then to the target file
-        file_path = current_dir.parent / "user_inputs.json"
+            # Navigate to the parent directory and then to the target file
+            file_path = current_dir.parent / "user_inputs.json"
 
-        # Open and load the JSON file
-        with open(file_path, "r") as json_file:
-            self.user_inputs = json.load(json_file)
+            # Open and load the JSON file
+            with open(file_path, "r") as json_file:
+                user_inputs = json.load(json_file)
+        self.user_inputs = user_inputs
 
         # Store message output function
         self.message_output = message_output or print
+        # Set while a run is streamed; receives typed pipeline events instead of plain messages
+        self.event_output = None
+
+        # Every artifact of this run goes into its own run directory, recorded in the manifest
+        self.manifest = RunManifest(metadata={"user_inputs": self.user_inputs})
+        # Stages hand results over in memory; the JSONL reports are an optional side output written in the background
+        self.report_writer = ReportWriter(self.manifest, enabled=self.user_inputs.get("write_reports", True))
+        # Wall time, CPU time, memory and counters of every stage, written to trace.jsonl in the run directory
+        self.tracer = StageTracer(self.manifest.path_for("trace.jsonl"), run_id=self.manifest.run_id)
+        self.manifest.add_artifact("trace", self.tracer.path)
 
         self.query = self.user_inputs["query"]
         self.papers_folder = self.user_inputs["papers_folder"]
         self.local_papers = self.user_inputs["local_papers"]
         self.option = self.user_inputs["option"]
         self.genie_api_url = "https://search.genie.stanford.edu/semantic_scholar"
+        self.embedding_batch_size = self.user_inputs.get("embedding_batch_size", 32)
+        # "exhaustive" embeds every chunk of the selected papers; "qdrant" searches the persistent index;
+        # "hybrid" embeds only the best BM25 candidates and fuses both rankings
+        self.retrieval_mode = self.user_inputs.get("retrieval_mode", "exhaustive")
+        self.sparse_candidates = self.user_inputs.get("sparse_candidates", 200)
+        self.rrf_k = self.user_inputs.get("rrf_k", 60)
+        self.top_k_chunks = self.user_inputs.get("top_k_chunks", 50)
+        self.collection_name = "paper_chunks"
+        # "transformers" (fp32 PyTorch), "int8" (dynamically quantized) or "onnx" (ONNX Runtime)
+        self.embedding_backend = self.user_inputs.get("embedding_backend")
+        # Vector store of "qdrant" mode: "qdrant" (server), "qdrant_local" (embedded Qdrant) or "mmap" (memory-mapped NumPy)
+        self.vector_store = self.user_inputs.get("vector_store")
+        # Token window shared by chunking, chunk embeddings and query embeddings
+        self.embedding_window = self.user_inputs.get("embedding_window", 512)
+        # "tokens" packs chunks to the embedding window; "characters" keeps the legacy 1500-character chunks
+        self.chunking = self.user_inputs.get("chunking", "tokens")
+        self.paper_ranker = PaperRanker(
+            top_k_chunks=self.top_k_chunks,
+            top_n_papers=self.user_inputs.get("top_n_papers"),
+            aggregation=self.user_inputs.get("paper_aggregation", "max"),
+            top_m=self.user_inputs.get("top_m", 3)
+        )
 
         # Initialize components
-        self.chunkenizer = Chunkenizer(self.papers_folder)     
-        self.embbedingator = Embbedingator()
-        self.perform_query = PerformQuery()
+        self.registry = registry or ModelRegistry.shared()
+        self.pdf_text_store = PdfTextStore()
+        self.embbedingator = Embbedingator(
+            registry=self.registry, backend=self.embedding_backend, max_length=self.embedding_window,
+            vector_store=self.vector_store
+        )
+        self.chunkenizer = Chunkenizer(
+            self.papers_folder,
+            pdf_text_store=self.pdf_text_store,
+            tokenizer_name=self.embbedingator.model_name if self.chunking == "tokens" else None,
+            chunk_tokens=self.embedding_window,
+            registry=self.registry
+        )
+        # Keywords of every ingested paper, looked up by nuanced question generation
+        self.keyword_index = KeywordIndex()
+        self.indexer = None
+        if self.retrieval_mode == "qdrant":
+            self.indexer = IncrementalIndexer(self.chunkenizer, self.embbedingator, collection_name=self.collection_name)
+            self.embbedingator.initialize_collection(
+                self.collection_name, vector_size=self.embbedingator.model.config.hidden_size
+            )
+        self.perform_query = PerformQuery(
+            collection_name=self.collection_name, registry=self.registry, backend=self.embedding_backend,
+            max_length=self.embedding_window, vector_store=self.vector_store
+        )
 
     def message(self, text):
         """
         Utility method to output messages
         """
-        if self.message_output:
+        if self.event_output:
+            self.event_output(StageMessage(text))
+        elif self.message_output:
             self.message_output(text)
 
+    def emit(self, event):
+        """
+        Utility method to output pipeline events
+        """
+        if self.event_output:
+            self.event_output(event)
+
+    def emit_scored(self, scope, results):
+        """
+        Output a ChunksScored event for a list of ScoredChunk objects.
+        """
+        best_similarity = max((result.similarity for result in results), default=None)
+        self.emit(ChunksScored(scope=scope, num_chunks=len(results), best_similarity=best_similarity))
+
     def process_local_papers(self):
         """
         Process and chunk local papers selected by the user.
@@ -56,14 +142,73 @@ class Coordinator:
             list: List of chunks from local papers.
         """
         self.message("📂 Processing papers in local folder ...")
-        chunks = []
-        for paper in self.local_papers:
-            file_path = paper
-            paper_chunks = self.chunkenizer.process_file(file_path)
-            for chunk in paper_chunks:
-                chunks.append({"source": paper, "content": chunk})
+        extraction_seconds = self.chunkenizer.extraction_seconds
+        with self.tracer.stage("chunking", scope="local") as counts:
+            chunks_by_paper = dict(self.chunkenizer.process_files(self.local_papers))
+            chunks = []
+            for paper in self.local_papers:
+                for chunk in chunks_by_paper[paper]:
+                    chunks.append({"source": paper, "content": chunk})
+            counts["papers"] = len(self.local_papers)
+            counts["chunks"] = len(chunks)
+        # Text extraction runs inside the chunking workers, so it is reported as the time they spent on it
+        self.tracer.add({
+            "stage": "pdf_extraction",
+            "scope": "local",
+            "worker_s": round(self.chunkenizer.extraction_seconds - extraction_seconds, 4),
+            "counts": {"papers": len(self.local_papers)}
+        })
         return chunks
 
+    def index_keywords(self, scope, file_paths=None, texts_by_paper=None):
+        """
+        Extract the keywords of ingested papers into the keyword index, skipping papers already indexed in their current version.
+        Args:
+            scope (str): 'local' or 'external', recorded in the trace.
+            file_paths (list): Paths of local papers.
+            texts_by_paper (dict): Full text of external papers, keyed by title.
+        """
+        with self.tracer.stage("keyword_indexing", scope=scope) as counts:
+            if file_paths is not None:
+                counts.update(self.keyword_index.index_files(file_paths, pdf_text_store=self.pdf_text_store))
+            else:
+                counts.update(self.keyword_index.index_texts(texts_by_paper))
+
+    def query_indexed_papers(self):
+        """
+        Retrieve the top-k chunks of the selected local papers from the persistent vector index.
+        New or modified papers are indexed first; unchanged papers are only checked for changes.
+        Returns:
+            list: ScoredChunk objects, best first.
+        """
+        self.message("📚 Searching the indexed local papers ...")
+        with self.tracer.stage("indexing", scope="local") as counts:
+            self.indexer.index_papers(self.local_papers)
+            counts["papers"] = len(self.local_papers)
+        with self.tracer.stage("similarity", scope="local") as counts:
+            hits = self.perform_query.query_index(self.query, top_k=self.top_k_chunks, paper_ids=self.local_papers)
+            counts["chunks"] = len(hits)
+        return [
+            ScoredChunk(source=hit.payload["paper_id"], content=hit.payload["chunk_text"], similarity=float(hit.score))
+            for hit in hits
+        ]
+
+    def retrieve_local_results(self):
+        """
+        Score the selected local papers against the query with the configured retrieval mode.
+        Returns:
+            list: ScoredChunk objects, best first.
+        """
+        if self.retrieval_mode == "qdrant":
+            results = self.query_indexed_papers()
+            self.index_keywords("local", file_paths=self.local_papers)
+            return results
+
+        local_chunks = self.process_local_papers()
+        self.index_keywords("local", file_paths=self.local_papers)
+        print("Calculating similarities for local papers...")
+        return self.score_chunks(local_chunks, scope="local")
+
     def fetch_external_papers(self):
         """
         Fetch external papers from Genie API.
@@ -81,7 +226,9 @@ class Coordinator:
         }
 
         try:
-            response = requests.post(self.genie_api_url, json=payload)
+            with self.tracer.stage("external_fetch") as counts:
+                response = requests.post(self.genie_api_url, json=payload)
+                counts["bytes"] = len(response.content)
             response.raise_for_status()
             data = response.json()
             external_papers = []
@@ -105,6 +252,7 @@ class Coordinator:
                     content_by_title[title] = content
 
             self.message(f"⛳️ I retrieved {len(external_papers)} relevant extracts from Genie API, which correspond to {len(content_by_title.keys())} papers.")
+            self.index_keywords("external", texts_by_paper=content_by_title)
             return external_papers, all_contents, content_by_title
 
         except requests.exceptions.RequestException as e:
@@ -122,88 +270,185 @@ class Coordinator:
             list: List of chunks from external papers.
         """
         self.message("⚙️ Processing papers retrieved form Genie API ...")
-        chunks = []
-        for paper in external_papers:
-            paper_chunks = self.chunkenizer.chunk_text(paper["content"])
-            for chunk in paper_chunks:
-                chunks.append({
-                    "source": paper["title"],
-                    "content": chunk,
-                    "url": paper["url"]
-                })
+        with self.tracer.stage("chunking", scope="external") as counts:
+            chunks = []
+            for paper in external_papers:
+                paper_chunks = self.chunkenizer.chunk_text(paper["content"])
+                for chunk in paper_chunks:
+                    chunks.append({
+                        "source": paper["title"],
+                        "content": chunk,
+                        "url": paper["url"]
+                    })
+            counts["papers"] = len(external_papers)
+            counts["chunks"] = len(chunks)
         return chunks
 
-    def calculate_similarities(self, chunks):
+    def dense_similarities(self, chunks, scope=None):
+        """
+        Embed chunks and calculate their cosine similarity to the query.
+        Args:
+            chunks (list): List of chunks to compare.
+            scope (str): Group of the chunks ('local' or 'external'), recorded in the trace.
+
+        Returns:
+            numpy.ndarray: Cosine similarity of each chunk, in the order of chunks.
+        """
+        counters = {}
+        if self.embbedingator.embedding_cache is not None:
+            counters["embedding_cache"] = self.embbedingator.embedding_cache.store.stats
+        with self.tracer.stage("embedding", counters=counters, scope=scope) as counts:
+            query_embedding = self.embbedingator.embed_text(self.query)
+            chunk_embeddings = self.embbedingator.embed_texts(
+                [chunk["content"] for chunk in chunks],
+                batch_size=self.embedding_batch_size
+            )
+            counts["chunks"] = len(chunks)
+        self.embbedingator.report_truncation()
+        with self.tracer.stage("similarity", scope=scope) as counts:
+            similarities = self.perform_query.calculate_similarities(query_embedding, chunk_embeddings)
+            counts["chunks"] = len(chunks)
+        return similarities
+
+    def calculate_similarities(self, chunks, scope=None):
         """
         Calculate similarity scores between the query and each chunk.
         Args:
             chunks (list): List of chunks to compare.
+            scope (str): Group of the chunks ('local' or 'external'), recorded in the trace.
+
+        Returns:
+            list: ScoredChunk objects, best first.
+        """
+        if not chunks:
+            return []
+        similarities = self.dense_similarities(chunks, scope=scope)
+        results = []
+        for chunk, similarity in zip(chunks, similarities):
+            results.append(ScoredChunk(
+                source=chunk["source"],
+                content=chunk["content"],
+                similarity=float(similarity),  # Ensure JSON serialization compatibility
+                url=chunk.get("url")  # Include URL if available
+            ))
+        return sorted(results, key=lambda x: x.similarity, reverse=True)
+
+    def score_chunks(self, chunks, scope=None):
+        """
+        Score chunks against the query with the configured retrieval mode.
+        Args:
+            chunks (list): List of chunks to compare.
+            scope (str): Group of the chunks ('local' or 'external'), recorded in the trace.
 
         Returns:
-            list: List of chunks with similarity scores.
+            list: ScoredChunk objects, best first.
+        """
+        if self.retrieval_mode == "hybrid":
+            return self.hybrid_similarities(chunks, scope=scope)
+        return self.calculate_similarities(chunks, scope=scope)
+
+    def hybrid_similarities(self, chunks, scope=None):
         """
-        query_embedding = self.embbedingator.embed_text(self.query)
+        Score chunks with BM25 and dense similarity fused by reciprocal rank fusion.
+        Only the sparse_candidates best BM25 chunks are embedded. If fewer than top_k_chunks chunks share
+        a term with the query, every chunk is embedded, as in exhaustive mode.
+        Args:
+            chunks (list): List of chunks to compare.
+            scope (str): Group of the chunks ('local' or 'external'), recorded in the trace.
+
+        Returns:
+            list: ScoredChunk objects, best first, with their cosine similarity and their fused score.
+        """
+        if not chunks:
+            return []
+        with self.tracer.stage("sparse", scope=scope) as counts:
+            # Built once per chunk set: the local chunks are only tokenized again when the papers or chunking change
+            sparse_index, index_source = SparseIndex.load_or_build(
+                [chunk["content"] for chunk in chunks], signature=self.chunkenizer.signature
+            )
+            counts["indexes_built"] = int(index_source == "built")
+            sparse_ranking = [position for position, _ in sparse_index.search(self.query, top_k=self.sparse_candidates)]
+            counts["chunks"] = len(chunks)
+            counts["candidates"] = len(sparse_ranking)
+
+        candidates = sparse_ranking
+        if len(candidates) < min(self.top_k_chunks, len(chunks)):
+            print(f"Only {len(candidates)} chunks match the query terms, embedding all {len(chunks)} chunks")
+            candidates = list(range(len(chunks)))
+        similarities = self.dense_similarities([chunks[position] for position in candidates], scope=scope)
+        dense_ranking = [candidates[i] for i in np.argsort(-similarities, kind="stable")]
+        similarity_by_position = dict(zip(candidates, similarities))
+
         results = []
-        for chunk in chunks:
-            chunk_embedding = self.embbedingator.embed_text(chunk["content"])
-            similarity = self.perform_query.calculate_similarity(query_embedding, chunk_embedding)
-            results.append({
-                "source": chunk["source"],
-                "content": chunk["content"],
-                "similarity": float(similarity),  # Ensure JSON serialization compatibility
-                "url": chunk.get("url")  # Include URL if available
-            })
-        return sorted(results, key=lambda x: x["similarity"], reverse=True)
-
-    def save_results(self, results, report_name, include_url=False):
-        """
-        Save results to a JSONL report file.
+        for position, score in reciprocal_rank_fusion([dense_ranking, sparse_ranking], k=self.rrf_k):
+            chunk = chunks[position]
+            results.append(ScoredChunk(
+                source=chunk["source"],
+                content=chunk["content"],
+                similarity=float(similarity_by_position[position]),
+                url=chunk.get("url"),
+                fused_score=round(score, 6)
+            ))
+        return results
+
+    def save_results(self, result, report_name, include_url=False):
+        """
+        Queue a JSONL report of a retrieval result, written in the background into the run directory.
         Args:
-            results (list): List of similarity results.
+            result (RetrievalResult): Selected papers and their best chunks.
             report_name (str): Name of the report file.
             include_url (bool): Whether to include URL in the report (for external papers).
 
         Returns:
-            str: Path to the saved report.
+            concurrent.futures.Future: Future resolving to the report path, or None if reports are disabled.
         """
-        sanitized_name = re.sub(r"[^a-zA-Z0-9_]", "_", report_name)
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_path = f"./{sanitized_name}_{timestamp}.jsonl"
+        return self.report_writer.submit(result, report_name, include_url=include_url)
 
-        with open(report_path, "w") as f:
-            for result in results:
-                # Prepare the JSON line
-                report_line = {
-                    "Source": result["source"],
-                    "Content": result["content"],
-                    "Similarity Score": result["similarity"]
-                }
-                # Add URL for external papers
-                if include_url and result.get("url"):
-                    report_line["URL"] = result["url"]
-
-                json.dump(report_line, f)
-                f.write("\n")
+    def run_pipeline(self, event_output=None):
+        """
+        Execute the pipeline based on user inputs.
+        Args:
+            event_output (callable): Receives the typed events of PipelineEvents as the run progresses,
+                including the progress messages. Messages go to message_output when omitted.
 
-        print(f"Report saved to {report_path}")
-        return report_path
+        Returns:
+            Path: Path to the policy memo, or None if no memo was written.
 
-    def run_pipeline(self):
+        Raises:
+            Exception: Any error raised by a stage, after the run manifest records the failure.
         """
-        Execute the pipeline based on user inputs.
+        self.event_output = event_output
+        try:
+            with self.tracer.stage("pipeline", option=self.option, retrieval_mode=self.retrieval_mode):
+                try:
+                    memo_path = self.run_stages()
+                finally:
+                    # Reports queued before a failing stage are still written
+                    self.report_writer.flush()
+        except Exception as e:
+            self.manifest.update(status="failed", error=str(e))
+            raise
+        self.manifest.update(status="completed")
+        return memo_path
+
+    def run_stages(self):
+        """
+        Run every stage of the pipeline, from retrieval to the memo.
+        Returns:
+            Path: Path to the policy memo, or None if no memo was written.
         """
         self.message("🚀 Starting research pipeline ...")
-        local_chunks = self.process_local_papers()
-
-        print("Calculating similarities for local papers...")
-        local_results = self.calculate_similarities(local_chunks)
-        self.save_results(local_results, "local_papers_report")
+        local_results = self.retrieve_local_results()
+        self.emit_scored("local", local_results)
+        local_selection = self.paper_ranker.select(local_results)
+        self.save_results(local_selection, "local_papers_report")
         all_external_contents = []
         content_by_title = {}
 
+        selection = local_selection
         if self.option != "2":
-            combined_results = local_results 
-            self.save_results(combined_results, "combined_report", include_url=True)
+            self.message(f"🏅 Selected {len(local_selection.papers)} papers for the analysis.")
+            self.save_results(local_selection, "combined_report", include_url=True)
 
 
         if self.option == "2":
@@ -213,22 +458,36 @@ class Coordinator:
             external_chunks = self.process_external_papers(external_papers)
 
             print("Calculating similarities for external papers...")
-            external_results = self.calculate_similarities(external_chunks)
-            self.save_results(external_results, "external_papers_report", include_url=True)
+            external_results = self.score_chunks(external_chunks, scope="external")
+            self.emit_scored("external", external_results)
+            external_selection = self.paper_ranker.select(external_results)
+            self.save_results(external_selection, "external_papers_report", include_url=True)
 
             print("Generating combined report...")
             combined_results = local_results + external_results
-            self.save_results(combined_results, "combined_report", include_url=True)
+            selection = self.paper_ranker.select(combined_results)
+            self.message(f"🏅 Selected {len(selection.papers)} papers for the analysis.")
+            self.save_results(selection, "combined_report", include_url=True)
         
         
-        # Generate memo
-        memo = GenerateMemo(message_output=self.message_output)
+        self.emit(PapersSelected(papers=selection.papers))
+
+        # Generate memo. The question answering stack is heavy to import, so it is loaded only when it runs.
+        from retriever.QuestionsAndAnswers.generateMemo import GenerateMemo
+
+        memo = GenerateMemo(
+            message_output=self.message, pdf_text_store=self.pdf_text_store, registry=self.registry,
+            embedding_backend=self.embedding_backend, manifest=self.manifest, event_output=self.event_output,
+            tracer=self.tracer, embedder=self.embbedingator, chunker=self.chunkenizer, keyword_index=self.keyword_index
+        )
 
 
 
         # Extract the 'query' field
         user_query = self.user_inputs.get("query")
-        memo.run(all_external_contents, content_by_title, user_query)
+        # The selected papers are handed over in rank order instead of being read back from the report
+        memo_path = memo.run(all_external_contents, content_by_title, user_query, relevant_papers=selection.sources)
+        return memo_path
 
 
 if __name__ == "__main__":
@@ -1,18 +1,13 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams
+from retriever.ModelRegistry import ModelRegistry
 
-# Connect to Qdrant
-client = QdrantClient(url="http://localhost:6333")
+# Connect to the vector store selected by VECTOR_STORE (the Qdrant server by default)
+vector_store = ModelRegistry.shared().get_vector_store()
 
-# Check if the collection exists, and delete it if it does
+# Delete the collection if it exists
 collection_name = "paper_chunks"
-if client.collection_exists(collection_name):
-    client.delete_collection(collection_name)
+vector_store.drop_collection(collection_name)
 
 # Now recreate the collection with the correct vector size
-client.create_collection(
-    collection_name=collection_name,
-    vectors_config=VectorParams(size=384, distance="Cosine")  # Set size to 384
-)
+vector_store.create_collection(collection_name, vector_size=384)  # Set size to 384
 
 print("Collection recreated with 384 dimensions.")
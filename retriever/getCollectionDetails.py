@@ -1,13 +1,13 @@
-from qdrant_client import QdrantClient
+from retriever.ModelRegistry import ModelRegistry
 
-# Connect to Qdrant
-client = QdrantClient(url="http://localhost:6333")  # Ensure Qdrant is running and available at this address
+# Connect to the vector store selected by VECTOR_STORE (the Qdrant server by default)
+vector_store = ModelRegistry.shared().get_vector_store()
 
 # Name of the collection you're checking
 collection_name = "paper_chunks"  # Replace this with the correct name of your collection
 
 # Retrieve collection information
-info = client.get_collection(collection_name)
+info = vector_store.collection_info(collection_name)
 
 # Print the collection details
 print(info)
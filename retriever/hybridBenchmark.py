@@ -0,0 +1,104 @@
+import argparse
+import tempfile
+import time
+import numpy as np
+from retriever.backendParity import DEFAULT_QUERIES, normalize
+from retriever.Chunkenizer import Chunkenizer
+from retriever.Embbedingator import Embbedingator
+from retriever.SparseIndex import SparseIndex, reciprocal_rank_fusion
+
+
+def evaluate_candidates(sparse_index, chunk_vectors, query, query_vector, num_candidates, top_k, rrf_k):
+    """
+    Compare hybrid retrieval with a given candidate set size against exhaustive dense retrieval for one query.
+    Args:
+        sparse_index (SparseIndex): Index over the chunks.
+        chunk_vectors (numpy.ndarray): Normalized chunk vectors.
+        query (str): Query text.
+        query_vector (numpy.ndarray): Normalized query vector.
+        num_candidates (int): Number of BM25 candidates that are embedded.
+        top_k (int): Size of the compared top of the ranking.
+        rrf_k (int): Damping constant of reciprocal rank fusion.
+
+    Returns:
+        dict: Number of embedded candidates, seconds of the sparse search, share of the exhaustive dense top-k
+            among the candidates (dense recall) and overlap of the fused top-k with the exhaustive dense top-k.
+    """
+    scores = chunk_vectors @ query_vector
+    reference_top = set(np.argsort(-scores)[:top_k])
+
+    start = time.perf_counter()
+    sparse_ranking = [position for position, _ in sparse_index.search(query, top_k=num_candidates)]
+    sparse_seconds = time.perf_counter() - start
+
+    candidates = sparse_ranking
+    if len(candidates) < min(top_k, len(chunk_vectors)):
+        # Same fallback as Coordinator.hybrid_similarities
+        candidates = list(range(len(chunk_vectors)))
+    dense_ranking = sorted(candidates, key=lambda position: -scores[position])
+    fused_top = [position for position, _ in reciprocal_rank_fusion([dense_ranking, sparse_ranking], k=rrf_k)[:top_k]]
+    return {
+        "embedded": len(candidates),
+        "sparse_s": sparse_seconds,
+        "dense_recall": len(reference_top & set(candidates)) / len(reference_top),
+        "fused_overlap": len(reference_top & set(fused_top)) / len(reference_top)
+    }
+
+
+if __name__ == "__main__":
+    print("Testing hybrid retrieval benchmark...")
+
+    parser = argparse.ArgumentParser(description="Measure the latency and recall of hybrid retrieval against exhaustive dense retrieval.")
+    parser.add_argument("--papers-folder", default="papers")
+    parser.add_argument("--model-name", default="BAAI/bge-small-en")
+    parser.add_argument("--max-chunks", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--candidates", nargs="+", type=int, default=[50, 100, 200, 400, 800])
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    args = parser.parse_args()
+
+    chunkenizer = Chunkenizer(args.papers_folder)
+    chunks = []
+    for _, paper_chunks in chunkenizer.process_files(chunkenizer.list_files()):
+        chunks.extend(paper_chunks)
+    chunks = chunks[:args.max_chunks]
+    top_k = min(args.top_k, len(chunks))
+    print(f"Benchmarking on {len(chunks)} chunks and {len(args.queries)} queries, top-{top_k}")
+
+    # The pipeline builds the index once per chunk set and finds it again by hashing the chunks on later queries
+    cache_dir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    sparse_index, _ = SparseIndex.load_or_build(chunks, cache_dir=cache_dir)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    SparseIndex.load_or_build(chunks, cache_dir=cache_dir)
+    lookup_seconds = time.perf_counter() - start
+    print(
+        f"Built the sparse index in {build_seconds:.3f}s ({len(sparse_index.postings)} terms), "
+        f"found it again in {lookup_seconds:.3f}s; the first query over these chunks pays the build"
+    )
+
+    # Embed without the cache, so the throughput reflects the cost of embedding chunks on a cold run
+    embbedingator = Embbedingator(model_name=args.model_name, use_cache=False)
+    embbedingator.embed_texts(chunks[:args.batch_size], batch_size=args.batch_size)
+    start = time.perf_counter()
+    chunk_vectors = normalize(embbedingator.embed_texts(chunks, batch_size=args.batch_size))
+    embed_seconds_per_chunk = (time.perf_counter() - start) / len(chunks)
+    query_vectors = normalize(embbedingator.embed_texts(args.queries, batch_size=args.batch_size))
+    print(f"Exhaustive dense: {len(chunks)} chunks embedded, {embed_seconds_per_chunk * len(chunks):.2f}s per cold query")
+
+    for num_candidates in args.candidates:
+        results = [
+            evaluate_candidates(sparse_index, chunk_vectors, query, query_vector, num_candidates, top_k, args.rrf_k)
+            for query, query_vector in zip(args.queries, query_vectors)
+        ]
+        embedded = np.mean([result["embedded"] for result in results])
+        latency = lookup_seconds + np.mean([result["sparse_s"] for result in results]) + embedded * embed_seconds_per_chunk
+        print(
+            f"{num_candidates} candidates: {embedded:.0f} chunks embedded, {latency:.2f}s per cold query "
+            f"({latency / (embed_seconds_per_chunk * len(chunks)):.2f}x), "
+            f"dense recall@{top_k} {np.mean([result['dense_recall'] for result in results]):.2f}, "
+            f"fused overlap@{top_k} {np.mean([result['fused_overlap'] for result in results]):.2f}"
+        )
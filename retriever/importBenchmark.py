@@ -0,0 +1,64 @@
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules on the startup path of ux.py
+MODULES = [
+    "retriever.coordinator",
+    "retriever.QuestionsAndAnswers.generateMemo",
+    "retriever.QuestionsAndAnswers.answer_questions",
+]
+
+# Heavy third-party packages that should only be imported by the stage that needs them
+HEAVY_PACKAGES = [
+    "torch", "transformers", "qdrant_client", "bertopic", "umap", "hdbscan",
+    "sklearn", "yake", "google.generativeai", "openai", "langchain_text_splitters",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure_import(module, repeats=3):
+    """
+    Measure the cold import time of a module, each time in a fresh interpreter.
+    Args:
+        module (str): Dotted name of the module to import.
+        repeats (int): Number of fresh interpreters to start.
+
+    Returns:
+        dict: Median and minimum import time in seconds, and the heavy packages the import loaded.
+    """
+    import json
+
+    repo_root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, PYTHONPATH=str(repo_root) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    timings = []
+    heavy = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+            capture_output=True, text=True, check=True, cwd=repo_root, env=env
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        heavy = result["heavy"]
+    return {"median": statistics.median(timings), "min": min(timings), "heavy": heavy}
+
+
+if __name__ == "__main__":
+    print("Testing import times...")
+
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for module in MODULES:
+        result = measure_import(module, repeats)
+        heavy = ", ".join(result["heavy"]) or "none"
+        print(f"{module}: median {result['median']:.3f}s, min {result['min']:.3f}s, heavy packages loaded: {heavy}")
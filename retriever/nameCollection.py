@@ -1,10 +1,10 @@
-from qdrant_client import QdrantClient
+from retriever.ModelRegistry import ModelRegistry
 
-# Connect to Qdrant
-client = QdrantClient(url="http://localhost:6333")
+# Connect to the vector store selected by VECTOR_STORE (the Qdrant server by default)
+vector_store = ModelRegistry.shared().get_vector_store()
 
 # Retrieve the list of collections
-collections = client.get_collections()
+collections = vector_store.list_collections()
 
 # Print the names of the collections
-print("Available collections:", collections.collections)
+print("Available collections:", collections)
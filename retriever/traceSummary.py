@@ -0,0 +1,100 @@
+import argparse
+import os
+from retriever.RunManifest import DEFAULT_RUNS_DIR
+from retriever.StageTracer import StageTracer
+
+
+def trace_path(run):
+    """
+    Find the trace file of a run.
+    Args:
+        run (str): Path to a trace file or run directory, or the ID of a run in runs/.
+
+    Returns:
+        str: Path to the trace.jsonl file.
+    """
+    if os.path.isfile(run):
+        return run
+    if os.path.isdir(run):
+        return os.path.join(run, "trace.jsonl")
+    return os.path.join(DEFAULT_RUNS_DIR, run, "trace.jsonl")
+
+
+def summarize(records):
+    """
+    Aggregate the records of one run per stage. Stages that ran more than once, e.g. chunking of local
+    and external papers, are reported per scope.
+    Args:
+        records (list): Records of StageTracer.
+
+    Returns:
+        dict: Totals of each stage, keyed by stage name and scope, in the order the stages first ran.
+    """
+    stages = {}
+    for record in records:
+        name = record["stage"] if not record.get("scope") else f"{record['stage']}[{record['scope']}]"
+        totals = stages.setdefault(name, {
+            "runs": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None,
+            "input_tokens": 0, "output_tokens": 0, "cache_hits": 0, "cache_misses": 0, "counts": {}
+        })
+        totals["runs"] += 1
+        # Work measured in worker processes only reports the time the workers spent on it
+        totals["wall_s"] += record.get("wall_s", record.get("worker_s", 0.0))
+        totals["cpu_s"] += record.get("cpu_s", 0.0)
+        if record.get("peak_rss_mb") is not None:
+            totals["peak_rss_mb"] = max(totals["peak_rss_mb"] or 0.0, record["peak_rss_mb"])
+        totals["input_tokens"] += record.get("llm", {}).get("input_tokens", 0)
+        totals["output_tokens"] += record.get("llm", {}).get("output_tokens", 0)
+        for label in ("llm_cache", "embedding_cache", "keyword_index"):
+            totals["cache_hits"] += record.get(label, {}).get("hits", 0)
+            totals["cache_misses"] += record.get(label, {}).get("misses", 0)
+        for key, value in record.get("counts", {}).items():
+            totals["counts"][key] = totals["counts"].get(key, 0) + value
+    return stages
+
+
+def format_stage(totals, baseline=None):
+    """
+    Format the totals of one stage in one run.
+    Args:
+        totals (dict): Totals returned by summarize(), or None if the stage did not run.
+        baseline (dict): Totals of the same stage in the first run, used to show the relative wall time.
+
+    Returns:
+        str: The formatted cell.
+    """
+    if totals is None:
+        return "-"
+    cell = f"{totals['wall_s']:.2f}s wall, {totals['cpu_s']:.2f}s cpu"
+    if baseline is not None and baseline["wall_s"] > 0:
+        cell += f" ({totals['wall_s'] / baseline['wall_s']:.2f}x)"
+    if totals["peak_rss_mb"] is not None:
+        cell += f", {totals['peak_rss_mb']:.0f}MB peak"
+    if totals["input_tokens"] or totals["output_tokens"]:
+        cell += f", {totals['input_tokens']}/{totals['output_tokens']} tokens in/out"
+    lookups = totals["cache_hits"] + totals["cache_misses"]
+    if lookups:
+        cell += f", {totals['cache_hits'] / lookups:.0%} cache hits"
+    if totals["counts"]:
+        cell += ", " + ", ".join(f"{value} {key}" for key, value in totals["counts"].items())
+    return cell
+
+
+if __name__ == "__main__":
+    print("Testing trace summary...")
+
+    parser = argparse.ArgumentParser(description="Summarize and compare the stage traces of pipeline runs.")
+    parser.add_argument("runs", nargs="+", help="Run IDs, run directories or trace.jsonl files. The first is the baseline.")
+    args = parser.parse_args()
+
+    summaries = [summarize(StageTracer.load(trace_path(run))) for run in args.runs]
+    stage_names = []
+    for summary in summaries:
+        stage_names.extend(name for name in summary if name not in stage_names)
+
+    for name in stage_names:
+        print(f"\n{name}")
+        baseline = summaries[0].get(name)
+        for run, summary in zip(args.runs, summaries):
+            totals = summary.get(name)
+            print(f"  {os.path.basename(os.path.normpath(run))}: {format_stage(totals, baseline if summary is not summaries[0] else None)}")
@@ -9,10 +9,92 @@ import sys
 import io
 import re
 import markdown
-from retriever.coordinator import Coordinator
+from retriever.JobRunner import JobQueueFull, JobRunner
+from retriever.ModelRegistry import ModelRegistry
+from retriever.PipelineEvents import ChunksScored, MemoToken, PaperAnswered, PapersSelected, PipelineFinished, QuestionsReady, StageMessage
 
 
 
+@st.cache_resource
+def get_model_registry():
+    """
+    Keep the loaded models and Qdrant clients alive across Streamlit reruns and sessions.
+    """
+    return ModelRegistry.shared()
+
+
+@st.cache_resource
+def get_job_runner():
+    """
+    Keep one job runner for the whole server, so every session's pipeline shares the bounded worker pool.
+    """
+    return JobRunner(max_workers=2, max_queued=8, registry=get_model_registry())
+
+
+def render_event(event, view, message_output):
+    """
+    Render one pipeline event as soon as it arrives.
+    Args:
+        event (object): Event of PipelineEvents.
+        view (dict): Rendering state of the run, e.g. the memo text streamed so far.
+        message_output (callable): Function that shows a progress message in the chat.
+    """
+    if isinstance(event, StageMessage):
+        message_output(event.text)
+    elif isinstance(event, ChunksScored):
+        if event.num_chunks:
+            st.caption(f"Scored {event.num_chunks} {event.scope} chunks (best similarity {event.best_similarity:.3f}).")
+    elif isinstance(event, PapersSelected):
+        with st.expander("Selected papers", expanded=True):
+            for paper in event.papers:
+                st.markdown(f"{paper.rank}. {paper.source} (score {paper.score:.3f})")
+    elif isinstance(event, QuestionsReady):
+        title = f"Nuanced questions for {event.paper_id}" if event.paper_id else "Comparison questions"
+        with st.expander(title):
+            st.markdown("\n".join(f"- {question}" for question in event.questions))
+    elif isinstance(event, PaperAnswered):
+        with st.expander(f"Answers for {event.paper_id}"):
+            st.json(event.answers)
+    elif isinstance(event, MemoToken):
+        # Show the memo while it is being written
+        if view.get("memo_placeholder") is None:
+            st.subheader("Policy Memo")
+            view["memo_placeholder"] = st.empty()
+            view["memo_text"] = ""
+        view["memo_text"] += event.text
+        view["memo_placeholder"].markdown(view["memo_text"])
+    elif isinstance(event, PipelineFinished):
+        view["memo_path"] = event.memo_path
+
+
+def follow_job(runner, job_id, message_output, poll_interval=0.5):
+    """
+    Poll a job and render its events until it finishes.
+    Args:
+        runner (JobRunner): Runner executing the job.
+        job_id (str): ID of the job.
+        message_output (callable): Function that shows a progress message in the chat.
+        poll_interval (float): Seconds between polls.
+
+    Returns:
+        dict: Final status of the job, with the memo path of a completed job.
+    """
+    view = {}
+    cursor = 0
+    status_placeholder = st.empty()
+    while True:
+        events, cursor, status = runner.poll(job_id, cursor)
+        if status["state"] == "queued":
+            status_placeholder.info(f"⏳ Your analysis is queued (position {status['queue_position']}). It will start as soon as a worker is free.")
+        else:
+            status_placeholder.empty()
+        for event in events:
+            render_event(event, view, message_output)
+        if status["state"] in ("completed", "failed") and not events:
+            return status
+        time.sleep(poll_interval)
+
+
 class PolicyChatbot:
     def __init__(self):
         """
@@ -115,15 +197,6 @@ class PolicyChatbot:
                 self.state['local_papers'] = selected_papers
                 self.state['current_stage'] = 'complete'
                 
-                # Save user inputs
-                with open('user_inputs.json', 'w') as f:
-                    json.dump({
-                        'query': self.state['query'],
-                        'analysis_option': self.state['analysis_option'],
-                        'papers_folder': self.state['papers_folder'],
-                        'local_papers': self.state['local_papers']
-                    }, f, indent=4)
-                
                 return f"👍 Great! I've saved the {len(selected_papers)} papers you indicated for analysis and will now start the research. " 
             
             except (ValueError, IndexError):
@@ -202,24 +275,17 @@ def main():
                 'local_papers': chatbot_state['local_papers']
             }
             
-            # Save to JSON for Coordinator
-            with open('user_inputs.json', 'w') as f:
-                json.dump(user_inputs, f, indent=4)
-            
             try:
-                # Call Coordinator
-                coordinator = Coordinator(message_output=message_output)
-                coordinator.run_pipeline()
-                
-                # Find the most recent memo file
-                directory_path = os.getcwd()
-                memo_files = [f for f in os.listdir(directory_path) if f.startswith('memo_') and f.endswith('.md')]
+                # Queue the run; its inputs and outputs stay private to this session's job
+                runner = get_job_runner()
+                st.session_state.job_id = runner.submit(user_inputs)
+                status = follow_job(runner, st.session_state.job_id, message_output)
+                if status["state"] == "failed":
+                    raise RuntimeError(status["error"])
+                markdown_file_path = status["memo_path"]
                 
-                if memo_files:
-                    # Sort files by modification time, most recent first
-                    most_recent_memo = max(memo_files, key=lambda f: os.path.getmtime(os.path.join(directory_path, f)))
-                    markdown_file_path = os.path.join(directory_path, most_recent_memo)
-                    
+                # The memo is written into the run directory recorded in the run's manifest
+                if markdown_file_path:
                     # Read and display Markdown file
                     if os.path.exists(markdown_file_path):
                         with open(markdown_file_path, 'r') as file:
@@ -234,6 +300,8 @@ def main():
                 else:
                     st.warning("No memo file found.")
                 
+            except JobQueueFull as e:
+                st.warning(f"The server is busy: {e}")
             except Exception as e:
                 st.error(f"Error in pipeline: {e}")
 